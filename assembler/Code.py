@@ -4,6 +4,60 @@ https://www.nand2tetris.org (Shimon Schocken and Noam Nisan, 2017)
 and as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0 
 Unported License (https://creativecommons.org/licenses/by-nc-sa/3.0/).
 """
+import functools
+from Parser import is_shift, split_c_command
+
+
+# Memoized whole C-instructions. Translator output repeats a few hundred
+# distinct lines, so this bound is never reached on real programs.
+C_INSTRUCTION_CACHE_SIZE = 4096
+
+DEST_CODES = {"null":"000", "M":"001", "D":"010", "MD":"011", "A":"100", "AM":"101", "AD":"110", "AMD":"111"}
+
+COMP_CODES = {
+    "0":"101010",
+    "1":"111111",
+    "-1":"111010",
+    "D":"001100",
+    "A":"110000",
+    "M":"110000",
+    "!D":"001101",
+    "!A":"110001",
+    "!M":"110001",
+    "-D":"001111",
+    "-A":"110011",
+    "-M":"110011",
+    "D+1":"011111",
+    "A+1":"110111",
+    "M+1":"110111",
+    "D-1":"001110",
+    "A-1":"110010",
+    "M-1":"110010",
+    "D+A":"000010",
+    "D+M":"000010",
+    "D-A":"010011",
+    "D-M":"010011",
+    "A-D":"000111",
+    "M-D":"000111",
+    "D&A":"000000",
+    "D&M":"000000",
+    "D|A":"010101",
+    "D|M":"010101",
+    "A+D":"000010",
+    "M+D":"000010",
+    "A&D":"000000",
+    "M&D":"000000",
+    "A|D":"010101",
+    "M|D":"010101",
+    "A<<":"100000",
+    "D<<":"110000",
+    "M<<":"100000",
+    "A>>":"000000",
+    "D>>":"010000",
+    "M>>":"000000"
+}
+
+JUMP_CODES = {"null":"000", "JGT":"001", "JEQ":"010", "JGE":"011", "JLT":"100", "JNE":"101", "JLE":"110", "JMP":"111"}
 
 
 class Code:
@@ -18,8 +72,7 @@ class Code:
         Returns:
             str: 3-bit long binary code of the given mnemonic.
         """
-        diction = {"null":"000", "M":"001", "D":"010", "MD":"011", "A":"100", "AM":"101", "AD":"110", "AMD":"111"}
-        return diction[mnemonic]
+        return DEST_CODES[mnemonic]
 
     @staticmethod
     def comp(mnemonic: str) -> str:
@@ -28,39 +81,10 @@ class Code:
             mnemonic (str): a comp mnemonic string.
 
         Returns:
-            str: 7-bit long binary code of the given mnemonic.
+            str: 6-bit long binary code of the given mnemonic, without the
+            a-bit.
         """
-        diction = {
-            "0":"101010",
-            "1":"111111",
-            "-1":"111010",
-            "D":"001100",
-            "A":"110000",
-            "M":"110000",
-            "!D":"001101",
-            "!A":"110001",
-            "!M":"110001",
-            "-D":"001111",
-            "-A":"110011",
-            "-M":"110011",
-            "D+1":"011111",
-            "A+1":"110111",
-            "M+1":"110111",
-            "D-1":"001110",
-            "A-1":"110010",
-            "M-1":"110010",
-            "D+A":"000010",
-            "D+M":"000010",
-            "D-A":"010011",
-            "D-M":"010011",
-            "A-D":"000111",
-            "M-D":"000111",
-            "D&A":"000000",
-            "D&M":"000000",
-            "D|A":"010101",
-            "D|M":"010101"
-        }
-        return diction[mnemonic]
+        return COMP_CODES[mnemonic]
 
     @staticmethod
     def jump(mnemonic: str) -> str:
@@ -71,6 +95,24 @@ class Code:
         Returns:
             str: 3-bit long binary code of the given mnemonic.
         """
-        diction = {"null":"000", "JGT":"001", "JEQ":"010", "JGE":"011", "JLT":"100", "JNE":"101", "JLE":"110", "JMP":"111"}
-        return diction[mnemonic]
+        return JUMP_CODES[mnemonic]
 
+    @staticmethod
+    @functools.lru_cache(maxsize=C_INSTRUCTION_CACHE_SIZE)
+    def c_instruction(command: str) -> int:
+        """Encodes a whole C-command. Results are memoized by the command
+        text, and Code.c_instruction.cache_info() reports the hit and miss
+        counters.
+
+        Args:
+            command (str): a C-command without comments or white space, e.g.
+            "AM=M-1" or "D;JEQ".
+
+        Returns:
+            int: the 16-bit machine word of the command.
+        """
+        dest, comp, jump = split_c_command(command)
+        prefix = "101" if is_shift(comp) else "111"
+        a_bit = "1" if "M" in comp else "0"
+        return int(prefix + a_bit + COMP_CODES[comp] + DEST_CODES[dest] +
+                   JUMP_CODES[jump], 2)
@@ -0,0 +1,146 @@
+"""This file is part of nand2tetris, as taught in The Hebrew University,
+and was written by Aviv Yaish according to the specifications given in
+https://www.nand2tetris.org (Shimon Schocken and Noam Nisan, 2017)
+and as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported License (https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import bisect
+import json
+import typing
+from Parser import L_COMMAND
+
+
+LISTING_EXTENSION = ".lst"
+LISTING_VERSION = 1
+
+
+class Listing:
+    """Maps ROM addresses back to the assembly source: the source line of
+    every instruction, the label it is under and the VM command it was
+    translated from, taken from the "//push constant 7" style comments the
+    VM translator writes before each command.
+
+    Labels and VM commands are stored once each, as (first address, name)
+    pairs sorted by address, so a lookup is a binary search and the JSON
+    file stays close to the size of the ROM itself. When several share an
+    address, the last one in the source is the one a lookup returns.
+    """
+
+    def __init__(self) -> None:
+        """Creates an empty listing."""
+        self.source = ""
+        self.lines = []
+        self.label_addresses = []
+        self.label_names = []
+        self.vm_command_addresses = []
+        self.vm_command_texts = []
+
+    def build(self, commands: typing.List[typing.Tuple[str, str, int]],
+              comments: typing.List[typing.Tuple[int, str]]) -> None:
+        """Fills the listing from a final command list. `source`, the name of
+        the assembled file, is left for the caller to set.
+
+        Args:
+            commands (typing.List[typing.Tuple[str, str, int]]): the commands
+            as they are encoded, after any optimization.
+            comments (typing.List[typing.Tuple[int, str]]): the whole-line
+            comments collected by the Parser.
+        """
+        self.lines = []
+        self.label_addresses = []
+        self.label_names = []
+        self.vm_command_addresses = []
+        self.vm_command_texts = []
+        comment_index = 0
+        for command_type, command, line_number in commands:
+            address = len(self.lines)
+            while comment_index < len(comments) and \
+                    comments[comment_index][0] < line_number:
+                self.vm_command_addresses.append(address)
+                self.vm_command_texts.append(comments[comment_index][1])
+                comment_index += 1
+            if command_type == L_COMMAND:
+                self.label_addresses.append(address)
+                self.label_names.append(command[1:-1])
+            else:
+                self.lines.append(line_number)
+
+    def lookup(self, address: int) -> typing.Tuple[
+            int, typing.Optional[str], typing.Optional[str]]:
+        """
+        Args:
+            address (int): a ROM address.
+
+        Returns:
+            typing.Tuple[int, typing.Optional[str], typing.Optional[str]]:
+            the source line of the instruction, the closest label at or
+            before it and the VM command it belongs to (None when there is
+            no such label or comment).
+        """
+        return (self.lines[address],
+                self._find(self.label_addresses, self.label_names, address),
+                self._find(self.vm_command_addresses, self.vm_command_texts,
+                           address))
+
+    def label_at(self, address: int) -> typing.Optional[str]:
+        """
+        Args:
+            address (int): a ROM address.
+
+        Returns:
+            typing.Optional[str]: the closest label at or before address.
+        """
+        return self._find(self.label_addresses, self.label_names, address)
+
+    def vm_command_at(self, address: int) -> typing.Optional[str]:
+        """
+        Args:
+            address (int): a ROM address.
+
+        Returns:
+            typing.Optional[str]: the VM command the instruction belongs to.
+        """
+        return self._find(self.vm_command_addresses, self.vm_command_texts,
+                          address)
+
+    def write(self, output_file: typing.TextIO) -> None:
+        """Writes the listing as JSON.
+
+        Args:
+            output_file (typing.TextIO): the listing file.
+        """
+        json.dump({"version": LISTING_VERSION, "source": self.source,
+                   "lines": self.lines,
+                   "labels": [self.label_addresses, self.label_names],
+                   "vm_commands": [self.vm_command_addresses,
+                                   self.vm_command_texts]},
+                  output_file, separators=(",", ":"))
+
+    @classmethod
+    def load(cls, input_file: typing.TextIO) -> "Listing":
+        """Reads a listing written by write().
+
+        Args:
+            input_file (typing.TextIO): the listing file.
+
+        Returns:
+            Listing: the listing.
+        """
+        data = json.load(input_file)
+        if data.get("version") != LISTING_VERSION:
+            raise ValueError("unsupported listing version " +
+                             str(data.get("version")))
+        listing = cls()
+        listing.source = data["source"]
+        listing.lines = data["lines"]
+        listing.label_addresses, listing.label_names = data["labels"]
+        listing.vm_command_addresses, listing.vm_command_texts = \
+            data["vm_commands"]
+        return listing
+
+    @staticmethod
+    def _find(addresses: typing.List[int], names: typing.List[str],
+              address: int) -> typing.Optional[str]:
+        """Returns the last name whose range starts at or before address."""
+        index = bisect.bisect_right(addresses, address) - 1
+        return names[index] if index >= 0 else None
@@ -7,25 +7,46 @@ Unported License (https://creativecommons.org/licenses/by-nc-sa/3.0/).
 import typing
 
 
+A_COMMAND = "A_COMMAND"
+C_COMMAND = "C_COMMAND"
+L_COMMAND = "L_COMMAND"
+
+
 class Parser:
     """Encapsulates access to the input code. Reads and assembly language 
     command, parses it, and provides convenient access to the commands 
     components (fields and symbols). In addition, removes all white space and 
     comments.
+
+    The whole input is classified in a single scan when the parser is created:
+    `commands` holds one (command type, command, line number) record per
+    A-, C- and L-command, with comments and all white space already removed,
+    and `labels` maps every label to the ROM address of the command after it.
     """
 
-    def __init__(self, input_file: typing.TextIO) -> None:
+    def __init__(self, input_file: typing.TextIO,
+                 keep_comments: bool = False) -> None:
         """Opens the input file and gets ready to parse it.
 
         Args:
             input_file (typing.TextIO): input file.
+            keep_comments (bool): also collect every whole-line comment as a
+            (line number, text) pair in `comments`.
         """
-        # Your code goes here!
-        # A good place to start is:
-        self.input_lines = input_file.read().splitlines()
+        self.commands = []
+        self.labels = {}
+        self.comments = [] if keep_comments else None
+        address = 0
+        for record in iter_commands(input_file, self.comments):
+            self.commands.append(record)
+            if record[0] == L_COMMAND:
+                self.labels[record[1][1:-1]] = address
+            else:
+                address += 1
         self.line_idx = 0
-        self.line_num = len(self.input_lines)
-        self.current_comment = self.input_lines[0]
+        self.line_num = len(self.commands)
+        self.current_comment = ""
+        self.current_type = None
         self.shifted = 0
 
     def has_more_commands(self) -> bool:
@@ -36,22 +57,15 @@ class Parser:
         """
         return self.line_idx < self.line_num
 
-
     def advance(self) -> None:
         """Reads the next command from the input and makes it the current command.
         Should be called only if has_more_commands() is true.
         """
-        while self.input_lines[self.line_idx] == '' or self.input_lines[self.line_idx][0] == '/':
-            self.input_lines.remove(self.input_lines[self.line_idx])
-            self.line_num -= 1
-
-
-        if self.has_more_commands():
-            self.current_comment = self.input_lines[self.line_idx]
-            self.remove_slash()
+        self.current_type, self.current_comment, _ = \
+            self.commands[self.line_idx]
+        self.shifted = int(is_shift(self.current_comment))
         self.line_idx += 1
 
-
     def command_type(self) -> str:
         """
         Returns:
@@ -60,17 +74,7 @@ class Parser:
             "C_COMMAND" for dest=comp;jump
             "L_COMMAND" (actually, pseudo-command) for (Xxx) where Xxx is a symbol
         """
-        if self.current_comment[0] == '@':
-            self.shifted = 0
-            return "A_COMMAND"
-        if ';' in self.current_comment or '=' in self.current_comment or '>>' in self.current_comment or '<<' in self.current_comment:
-            if '<<' in self.current_comment or '>>' in self.current_comment:
-                self.shifted = 1
-            return "C_COMMAND"
-        if '(' == self.current_comment[0] and ')' == self.current_comment[-1]:
-            self.shifted = 0
-            return "L_COMMAND"
-
+        return self.current_type
 
     def symbol(self) -> str:
         """
@@ -79,25 +83,18 @@ class Parser:
             (Xxx). Should be called only when command_type() is "A_COMMAND" or
             "L_COMMAND".
         """
-        if self.command_type() == "A_COMMAND":
-            self.current_comment.lstrip()
-            self.current_comment = self.current_comment[1:]
-            return self.current_comment
-        if self.command_type() == "L_COMMAND":
+        if self.current_type == A_COMMAND:
+            return self.current_comment[1:]
+        if self.current_type == L_COMMAND:
             return self.current_comment[1:-1]
 
-
     def dest(self) -> str:
         """
         Returns:
             str: the dest mnemonic in the current C-command. Should be called
             only when commandType() is "C_COMMAND".
         """
-        if self.command_type() == "C_COMMAND":
-            if '=' in self.current_comment:
-                eql_idx = self.current_comment.find('=')
-                return self.current_comment[:eql_idx]
-        return "null"
+        return split_c_command(self.current_comment)[0]
 
     def comp(self) -> str:
         """
@@ -105,21 +102,7 @@ class Parser:
             str: the comp mnemonic in the current C-command. Should be called
             only when commandType() is "C_COMMAND".
         """
-        if self.command_type() == "C_COMMAND":
-            if ';' in self.current_comment and '=' in self.current_comment:
-                sc_idx = self.current_comment.find(';')
-                eql_idx = self.current_comment.find('=')
-                return self.current_comment[eql_idx+1:sc_idx]
-            elif ';' in self.current_comment:
-                sc_idx = self.current_comment.find(';')
-                return self.current_comment[:sc_idx]
-            elif '=' in self.current_comment:
-                eql_idx = self.current_comment.find('=')
-                return self.current_comment[eql_idx+1:]
-            else:
-                return 'null'
-        else:
-            return 'null'
+        return split_c_command(self.current_comment)[1]
 
     def jump(self) -> str:
         """
@@ -127,15 +110,80 @@ class Parser:
             str: the jump mnemonic in the current C-command. Should be called
             only when commandType() is "C_COMMAND".
         """
-        if self.command_type() == "C_COMMAND" and ';' in self.current_comment:
-            sc_idx = self.current_comment.find(';')
-            return self.current_comment[sc_idx+1:]
-        return 'null'
-
-    def remove_slash(self):
-        if '//' in self.current_comment:
-            s_ind = self.current_comment.find('/')
-            self.current_comment = self.current_comment[:s_ind].rstrip()
-
-        self.current_comment = self.current_comment.lstrip()
-        self.current_comment = self.current_comment.rstrip()
\ No newline at end of file
+        return split_c_command(self.current_comment)[2]
+
+
+def iter_commands(
+        lines: typing.Iterable[str],
+        comments: typing.Optional[typing.List[typing.Tuple[int, str]]] = None
+) -> typing.Iterator[typing.Tuple[str, str, int]]:
+    """Classifies the commands of an assembly program one line at a time,
+    without keeping the lines around.
+
+    Args:
+        lines (typing.Iterable[str]): the lines of the program, e.g. an open
+        file.
+        comments (typing.Optional[typing.List[typing.Tuple[int, str]]]): if
+        given, the line number and text of every whole-line comment, such
+        as the "//push constant 7" the VM translator writes before each VM
+        command, are appended to it.
+
+    Yields:
+        typing.Tuple[str, str, int]: the type, cleaned text and line number
+        of every A-, C- and L-command.
+    """
+    for line_number, line in enumerate(lines, 1):
+        command = clean_line(line)
+        if not command:
+            if comments is not None and line.lstrip().startswith('//'):
+                comments.append((line_number, line.strip()[2:].strip()))
+            continue
+        if command[0] == '@':
+            yield A_COMMAND, command, line_number
+        elif command[0] == '(' and command[-1] == ')':
+            yield L_COMMAND, command, line_number
+        else:
+            yield C_COMMAND, command, line_number
+
+
+def clean_line(line: str) -> str:
+    """
+    Args:
+        line (str): a raw line of assembly code.
+
+    Returns:
+        str: the line without its comment and without any white space, so
+        "M = M+1 // inc" becomes "M=M+1". Empty for blank and comment lines.
+    """
+    comment_idx = line.find('//')
+    if comment_idx != -1:
+        line = line[:comment_idx]
+    return "".join(line.split())
+
+
+def is_shift(command: str) -> bool:
+    """
+    Args:
+        command (str): a cleaned command.
+
+    Returns:
+        bool: True if the command is one of the shift C-commands.
+    """
+    return '<<' in command or '>>' in command
+
+
+def split_c_command(command: str) -> typing.Tuple[str, str, str]:
+    """
+    Args:
+        command (str): a cleaned C-command, dest=comp;jump.
+
+    Returns:
+        typing.Tuple[str, str, str]: the dest, comp and jump mnemonics, with
+        "null" for a missing dest or jump.
+    """
+    eql_idx = command.find('=')
+    sc_idx = command.find(';')
+    dest = command[:eql_idx] if eql_idx != -1 else "null"
+    if sc_idx != -1:
+        return dest, command[eql_idx + 1:sc_idx], command[sc_idx + 1:]
+    return dest, command[eql_idx + 1:], "null"
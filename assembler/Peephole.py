@@ -0,0 +1,291 @@
+"""This file is part of nand2tetris, as taught in The Hebrew University,
+and was written by Aviv Yaish according to the specifications given in
+https://www.nand2tetris.org (Shimon Schocken and Noam Nisan, 2017)
+and as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported License (https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import typing
+from Parser import A_COMMAND, C_COMMAND, L_COMMAND, split_c_command
+
+
+Command = typing.Tuple[str, str, int]
+
+REDUNDANT_LOADS = "redundant loads"
+CANCELLED_UPDATES = "cancelled updates"
+THREADED_JUMPS = "threaded jumps"
+UNREACHABLE_CODE = "unreachable code"
+
+# M=M+1 followed by an update of the same cell with M-1, and vice versa.
+_INVERSE_COMP = {"M+1": "M-1", "M-1": "M+1"}
+
+
+class PeepholeOptimizer:
+    """Removes wasted instructions from a parsed assembly program before it
+    is encoded. The program is the Parser's command list, and the optimizer
+    relies on two properties of translator output: jumps only ever target
+    labels, and the A register is only read by the instructions right after
+    the one that set it.
+
+    `counts` holds how many times each rule fired and `saved_words` the
+    number of ROM words removed, accumulated over every optimized program.
+    """
+
+    def __init__(self) -> None:
+        """Creates an optimizer with zeroed counters."""
+        self.counts = {REDUNDANT_LOADS: 0, CANCELLED_UPDATES: 0,
+                       THREADED_JUMPS: 0, UNREACHABLE_CODE: 0}
+        self.saved_words = 0
+
+    def optimize(self, commands: typing.List[Command]) \
+            -> typing.List[Command]:
+        """Runs every rule until none of them changes the program.
+
+        Args:
+            commands (typing.List[Command]): the parsed program.
+
+        Returns:
+            typing.List[Command]: the optimized program. Labels are kept, so
+            their addresses must be recomputed from it.
+        """
+        before = _count_words(commands)
+        changed = True
+        while changed:
+            changed = False
+            for rule in (self.remove_unreachable_code, self.thread_jumps,
+                         self.eliminate_redundant_loads,
+                         self.cancel_updates):
+                commands, fired = rule(commands)
+                changed = changed or fired > 0
+        self.saved_words += before - _count_words(commands)
+        return commands
+
+    def eliminate_redundant_loads(self, commands: typing.List[Command]) \
+            -> typing.Tuple[typing.List[Command], int]:
+        """Drops A-instructions whose value is never used or is already in
+        the A register: an @X followed directly by another A-instruction, an
+        @X while A still holds X, and an @X, A=M pair while A still holds
+        the RAM[X] loaded by the same pair and no memory was written since.
+
+        Args:
+            commands (typing.List[Command]): the program.
+
+        Returns:
+            typing.Tuple[typing.List[Command], int]: the new program and the
+            number of instructions removed.
+        """
+        result = []
+        # None, ("const", X) for A == X, or ("deref", X) for A == RAM[X].
+        known_a = None
+        removed = 0
+        index = 0
+        while index < len(commands):
+            command = commands[index]
+            command_type, text, _ = command
+            index += 1
+            if command_type == L_COMMAND:
+                known_a = None
+            elif command_type == A_COMMAND:
+                symbol = text[1:]
+                following = _peek(commands, index)
+                if following is not None and following[0] == A_COMMAND:
+                    removed += 1
+                    continue
+                if known_a == ("const", symbol):
+                    removed += 1
+                    continue
+                if known_a == ("deref", symbol) and index < len(commands) \
+                        and commands[index][:2] == (C_COMMAND, "A=M"):
+                    removed += 2
+                    index += 1
+                    continue
+                known_a = ("const", symbol)
+            else:
+                dest, comp, _ = split_c_command(text)
+                if "A" in dest:
+                    if dest == "A" and comp == "M" and known_a is not None \
+                            and known_a[0] == "const":
+                        known_a = ("deref", known_a[1])
+                    else:
+                        known_a = None
+                elif "M" in dest and known_a is not None and \
+                        known_a[0] == "deref":
+                    known_a = None
+            result.append(command)
+        self.counts[REDUNDANT_LOADS] += removed
+        return result, removed
+
+    def cancel_updates(self, commands: typing.List[Command]) \
+            -> typing.Tuple[typing.List[Command], int]:
+        """Cancels an M=M+1 that is immediately undone by an M-1 update of
+        the same cell (or the other way around), the remains of a push that
+        is directly followed by a pop. M=M+1, AM=M-1 becomes A=M, and
+        M=M+1, M=M-1 disappears.
+
+        Args:
+            commands (typing.List[Command]): the program.
+
+        Returns:
+            typing.Tuple[typing.List[Command], int]: the new program and the
+            number of instructions removed.
+        """
+        result = []
+        removed = 0
+        index = 0
+        while index < len(commands):
+            command = commands[index]
+            following = commands[index + 1] \
+                if index + 1 < len(commands) else None
+            index += 1
+            if command[0] == C_COMMAND and following is not None and \
+                    following[0] == C_COMMAND:
+                dest, comp, jump = split_c_command(command[1])
+                next_dest, next_comp, next_jump = \
+                    split_c_command(following[1])
+                if dest == "M" and jump == "null" and next_jump == "null" \
+                        and "M" in next_dest and \
+                        _INVERSE_COMP.get(comp) == next_comp:
+                    index += 1
+                    remaining_dest = next_dest.replace("M", "")
+                    if remaining_dest:
+                        result.append((C_COMMAND, remaining_dest + "=M",
+                                       following[2]))
+                        removed += 1
+                    else:
+                        removed += 2
+                    continue
+            result.append(command)
+        self.counts[CANCELLED_UPDATES] += removed
+        return result, removed
+
+    def thread_jumps(self, commands: typing.List[Command]) \
+            -> typing.Tuple[typing.List[Command], int]:
+        """Retargets jumps to a label whose code is just @T, 0;JMP so they
+        jump to T directly.
+
+        Args:
+            commands (typing.List[Command]): the program.
+
+        Returns:
+            typing.Tuple[typing.List[Command], int]: the new program and the
+            number of jumps retargeted. No instruction is removed, but the
+            trampolines may become unreachable.
+        """
+        label_index = {}
+        for index, (command_type, text, _) in enumerate(commands):
+            if command_type == L_COMMAND:
+                label_index[text[1:-1]] = index
+
+        def trampoline_target(label: str) -> typing.Optional[str]:
+            load_index = _next_index(commands, label_index[label] + 1)
+            if load_index is None:
+                return None
+            command_type, text, _ = commands[load_index]
+            if command_type != A_COMMAND or text[1:] not in label_index:
+                return None
+            jump = _peek(commands, load_index + 1)
+            if jump is None or jump[0] != C_COMMAND or \
+                    split_c_command(jump[1])[::2] != ("null", "JMP"):
+                return None
+            return text[1:]
+
+        result = list(commands)
+        threaded = 0
+        for index in range(len(commands) - 1):
+            command_type, text, line_number = commands[index]
+            if command_type != A_COMMAND or text[1:] not in label_index:
+                continue
+            if not _is_pure_jump(commands, index + 1):
+                continue
+            chain = [text[1:]]
+            next_target = trampoline_target(chain[-1])
+            while next_target is not None and next_target not in chain:
+                chain.append(next_target)
+                next_target = trampoline_target(next_target)
+            # A chain that loops, like (END) @END 0;JMP, is threaded only up
+            # to its loop, so that threading the result again is a no-op.
+            target = chain[-1] if next_target is None else next_target
+            if target != text[1:]:
+                result[index] = (A_COMMAND, "@" + target, line_number)
+                threaded += 1
+        self.counts[THREADED_JUMPS] += threaded
+        return result, threaded
+
+    def remove_unreachable_code(self, commands: typing.List[Command]) \
+            -> typing.Tuple[typing.List[Command], int]:
+        """Removes the instructions between an unconditional jump and the
+        next label that is referenced anywhere in the program. Labels that
+        nothing refers to are removed along with the dead code after them.
+
+        Args:
+            commands (typing.List[Command]): the program.
+
+        Returns:
+            typing.Tuple[typing.List[Command], int]: the new program and the
+            number of instructions removed.
+        """
+        referenced = {text[1:] for command_type, text, _ in commands
+                      if command_type == A_COMMAND}
+        result = []
+        removed = 0
+        reachable = True
+        for command in commands:
+            command_type, text, _ = command
+            if command_type == L_COMMAND and text[1:-1] in referenced:
+                reachable = True
+            if not reachable:
+                if command_type != L_COMMAND:
+                    removed += 1
+                continue
+            result.append(command)
+            if command_type == C_COMMAND and text.endswith(";JMP"):
+                reachable = False
+        self.counts[UNREACHABLE_CODE] += removed
+        return result, removed
+
+    def report(self) -> str:
+        """
+        Returns:
+            str: a one line summary of the counters.
+        """
+        return "peephole saved " + str(self.saved_words) + " ROM words (" + \
+            ", ".join([str(count) + " " + rule
+                       for rule, count in self.counts.items()]) + ")"
+
+
+def _count_words(commands: typing.List[Command]) -> int:
+    return sum(1 for command in commands if command[0] != L_COMMAND)
+
+
+def _next_index(commands: typing.List[Command],
+                index: int) -> typing.Optional[int]:
+    """Returns the index of the first A- or C-command at or after index, or
+    None."""
+    while index < len(commands):
+        if commands[index][0] != L_COMMAND:
+            return index
+        index += 1
+    return None
+
+
+def _peek(commands: typing.List[Command],
+          index: int) -> typing.Optional[Command]:
+    """Returns the first A- or C-command at or after index, or None."""
+    index = _next_index(commands, index)
+    return None if index is None else commands[index]
+
+
+def _is_pure_jump(commands: typing.List[Command], index: int) -> bool:
+    """Is commands[index] a jump that uses A only as its target? For a
+    conditional jump, A must also be reloaded before the fall-through path
+    can read it.
+    """
+    command_type, text, _ = commands[index]
+    if command_type != C_COMMAND:
+        return False
+    dest, comp, jump = split_c_command(text)
+    if jump == "null" or "A" in comp or "M" in comp or "M" in dest:
+        return False
+    if jump == "JMP":
+        return True
+    following = _peek(commands, index + 1)
+    return following is None or following[0] == A_COMMAND
@@ -0,0 +1,107 @@
+"""This file is part of nand2tetris, as taught in The Hebrew University,
+and was written by Aviv Yaish according to the specifications given in  
+https://www.nand2tetris.org (Shimon Schocken and Noam Nisan, 2017)
+and as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0 
+Unported License (https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import array
+import hashlib
+import mmap
+import struct
+import sys
+import typing
+
+
+# A packed ROM file is a fixed 32 byte header followed by the instructions as
+# little-endian uint16 words:
+#   magic (4s) | version (H) | reserved (H) | instruction count (I) |
+#   source hash (16s) | padding (4x)
+ROM_MAGIC = b"HROM"
+ROM_VERSION = 1
+ROM_HEADER = struct.Struct("<4sHHI16s4x")
+ROM_EXTENSION = ".rom"
+SOURCE_HASH_SIZE = 16
+
+
+def source_hash(source: str) -> bytes:
+    """
+    Args:
+        source (str): the assembly source the ROM was built from.
+
+    Returns:
+        bytes: a 16 byte digest of the source, stored in the ROM header.
+    """
+    return hashlib.blake2b(
+        source.encode(), digest_size=SOURCE_HASH_SIZE).digest()
+
+
+def write_rom(words: typing.Sequence[int], output_file: typing.BinaryIO,
+              digest: bytes) -> None:
+    """Writes machine words as a packed ROM file.
+
+    Args:
+        words (typing.Sequence[int]): the 16-bit machine words.
+        output_file (typing.BinaryIO): writes the ROM to this binary file.
+        digest (bytes): the source hash, see source_hash().
+    """
+    packed = array.array("H", words)
+    if sys.byteorder != "little":
+        packed.byteswap()
+    output_file.write(ROM_HEADER.pack(
+        ROM_MAGIC, ROM_VERSION, 0, len(packed), digest))
+    output_file.write(packed.tobytes())
+
+
+class RomFile:
+    """A packed ROM file, memory-mapped read-only. The instructions are
+    exposed without copying or parsing them: `words` is a memoryview of
+    unsigned 16-bit integers over the mapping, and as_numpy() returns a NumPy
+    view of the same memory.
+    """
+
+    def __init__(self, path: str) -> None:
+        """Maps the ROM file and validates its header.
+
+        Args:
+            path (str): path of the packed ROM file.
+        """
+        with open(path, "rb") as rom_file:
+            self.map = mmap.mmap(rom_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.map) < ROM_HEADER.size:
+            self.map.close()
+            raise ValueError(path + " is too short to be a ROM file")
+        magic, version, _, self.count, self.source_hash = \
+            ROM_HEADER.unpack_from(self.map)
+        end = ROM_HEADER.size + 2 * self.count
+        if magic != ROM_MAGIC or version != ROM_VERSION or \
+                len(self.map) < end:
+            self.map.close()
+            raise ValueError(path + " is not a valid ROM file")
+        if sys.byteorder == "little":
+            self.words = memoryview(self.map)[ROM_HEADER.size:end].cast("H")
+        else:
+            self.words = array.array("H", self.map[ROM_HEADER.size:end])
+            self.words.byteswap()
+
+    def as_numpy(self):
+        """
+        Returns:
+            numpy.ndarray: a read-only little-endian uint16 view of the
+            instructions. Requires NumPy.
+        """
+        import numpy
+        return numpy.frombuffer(self.map, dtype="<u2", count=self.count,
+                                offset=ROM_HEADER.size)
+
+    def close(self) -> None:
+        """Releases the mapping. Views returned by as_numpy() must be
+        released first."""
+        if isinstance(self.words, memoryview):
+            self.words.release()
+        self.map.close()
+
+    def __enter__(self) -> "RomFile":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
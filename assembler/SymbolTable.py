@@ -4,12 +4,32 @@ https://www.nand2tetris.org (Shimon Schocken and Noam Nisan, 2017)
 and as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0 
 Unported License (https://creativecommons.org/licenses/by-nc-sa/3.0/).
 """
+import array
+import types
+
+
+VARIABLE_BASE_ADDRESS = 16
+# Address of a symbol that was interned before it was defined.
+UNRESOLVED = -1
+
+PREDEFINED_SYMBOLS = types.MappingProxyType(dict(
+    [("R" + str(i), i) for i in range(16)] +
+    [("SP", 0), ("LCL", 1), ("ARG", 2), ("THIS", 3), ("THAT", 4),
+     ("SCREEN", 16384), ("KBD", 24576)]))
+_PREDEFINED_IDS = types.MappingProxyType(
+    {symbol: symbol_id for symbol_id, symbol in enumerate(PREDEFINED_SYMBOLS)})
+_PREDEFINED_ADDRESSES = array.array("i", PREDEFINED_SYMBOLS.values())
 
 
 class SymbolTable:
     """
     A symbol table that keeps a correspondence between symbolic labels and 
     numeric addresses.
+
+    Every symbol is interned to a small integer ID that indexes the
+    `addresses` array. The predefined symbols are built once per process and
+    copied into each new table, so creating a table costs the same for every
+    file of a batch.
     """
 
     def __init__(self) -> None:
@@ -17,8 +37,26 @@ class SymbolTable:
         and their pre-allocated RAM addresses, according to section 6.2.3 of the
         book.
         """
-        # Your code goes here!
-        pass
+        self.ids = dict(_PREDEFINED_IDS)
+        self.addresses = array.array("i", _PREDEFINED_ADDRESSES)
+        self.next_variable = VARIABLE_BASE_ADDRESS
+
+    def intern(self, symbol: str) -> int:
+        """Returns the ID of a symbol, giving it a new one with an UNRESOLVED
+        address if it is not in the table yet.
+
+        Args:
+            symbol (str): a symbol.
+
+        Returns:
+            int: the ID of the symbol, an index into `addresses`.
+        """
+        symbol_id = self.ids.get(symbol)
+        if symbol_id is None:
+            symbol_id = len(self.addresses)
+            self.ids[symbol] = symbol_id
+            self.addresses.append(UNRESOLVED)
+        return symbol_id
 
     def add_entry(self, symbol: str, address: int) -> None:
         """Adds the pair (symbol, address) to the table.
@@ -27,8 +65,38 @@ class SymbolTable:
             symbol (str): the symbol to add.
             address (int): the address corresponding to the symbol.
         """
-        # Your code goes here!
-        pass
+        self.addresses[self.intern(symbol)] = address
+
+    def add_variable(self, symbol: str) -> int:
+        """Allocates the next free RAM address, starting at 16, to a symbol.
+
+        Args:
+            symbol (str): the variable to add.
+
+        Returns:
+            int: the address allocated to the variable.
+        """
+        address = self.next_variable
+        self.next_variable += 1
+        self.addresses[self.intern(symbol)] = address
+        return address
+
+    def resolve(self, symbol: str) -> int:
+        """Returns the address of a symbol, allocating it as a new variable
+        if it has none yet. This is how the second pass resolves @Xxx.
+
+        Args:
+            symbol (str): a symbol.
+
+        Returns:
+            int: the address associated with the symbol.
+        """
+        symbol_id = self.ids.get(symbol)
+        if symbol_id is not None:
+            address = self.addresses[symbol_id]
+            if address != UNRESOLVED:
+                return address
+        return self.add_variable(symbol)
 
     def contains(self, symbol: str) -> bool:
         """Does the symbol table contain the given symbol?
@@ -39,8 +107,9 @@ class SymbolTable:
         Returns:
             bool: True if the symbol is contained, False otherwise.
         """
-        # Your code goes here!
-        pass
+        symbol_id = self.ids.get(symbol)
+        return symbol_id is not None and \
+            self.addresses[symbol_id] != UNRESOLVED
 
     def get_address(self, symbol: str) -> int:
         """Returns the address associated with the symbol.
@@ -51,5 +120,4 @@ class SymbolTable:
         Returns:
             int: the address associated with the symbol.
         """
-        # Your code goes here!
-        pass
+        return self.addresses[self.ids[symbol]]
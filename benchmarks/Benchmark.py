@@ -0,0 +1,261 @@
+"""This file is part of nand2tetris, as taught in The Hebrew University,
+and was written by Aviv Yaish according to the specifications given in
+https://www.nand2tetris.org (Shimon Schocken and Noam Nisan, 2017)
+and as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported License (https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import typing
+from Generators import generate_asm, generate_vm
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ASSEMBLER_DIR = os.path.join(ROOT, "assembler")
+TRANSLATOR_DIR = os.path.join(ROOT, "ex_7")
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000]
+SUITES = ["assembler", "translator"]
+
+
+def run_assembler_stages(input_path: str) -> typing.Dict[str, float]:
+    """Times the assembler's stages on one file. Runs inside the child
+    process started by measure().
+
+    Args:
+        input_path (str): the .asm file.
+
+    Returns:
+        typing.Dict[str, float]: seconds per stage, and the hit and miss
+        counters of the C-instruction cache.
+    """
+    sys.path.insert(0, ASSEMBLER_DIR)
+    from Code import Code
+    from Main import assemble_stream, encode
+    from Parser import Parser
+    from SymbolTable import SymbolTable
+
+    timings = {}
+    start = time.perf_counter()
+    with open(input_path) as input_file:
+        parser = Parser(input_file)
+    timings["parse"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    symbol_table = SymbolTable()
+    for label, address in parser.labels.items():
+        symbol_table.add_entry(label, address)
+    words = encode(parser.commands, symbol_table)
+    timings["encode"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    text = "".join([format(word, "016b") + "\n" for word in words])
+    timings["format"] = time.perf_counter() - start
+
+    del parser, words, text
+    start = time.perf_counter()
+    with open(input_path) as input_file, \
+            open(os.devnull, "w") as output_file:
+        assemble_stream(input_file, output_file)
+    timings["stream"] = time.perf_counter() - start
+    cache_info = Code.c_instruction.cache_info()
+    timings["c_cache_hits"] = cache_info.hits
+    timings["c_cache_misses"] = cache_info.misses
+    return timings
+
+
+def run_translator_stages(input_path: str) -> typing.Dict[str, float]:
+    """Times the VM translator's stages on one file. Runs inside the child
+    process started by measure().
+
+    Args:
+        input_path (str): the .vm file.
+
+    Returns:
+        typing.Dict[str, float]: seconds per stage.
+    """
+    sys.path.insert(0, TRANSLATOR_DIR)
+    from CodeWriter import CodeWriter
+    from Main import translate_file
+    from Parser import Parser
+
+    timings = {}
+    start = time.perf_counter()
+    with open(input_path) as input_file:
+        Parser(input_file)
+    timings["parse"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with open(input_path) as input_file, \
+            open(os.devnull, "w") as output_file:
+        code_writer = CodeWriter(output_file)
+        translate_file(input_file, output_file, code_writer)
+    timings["translate"] = time.perf_counter() - start
+    return timings
+
+
+STAGE_RUNNERS = {"assembler": run_assembler_stages,
+                 "translator": run_translator_stages}
+
+
+def measure(suite: str, input_path: str) -> typing.Dict[str, typing.Any]:
+    """Runs one suite on one file in a fresh process, so that the peak RSS
+    belongs to that run alone.
+
+    Args:
+        suite (str): "assembler" or "translator".
+        input_path (str): the generated input file.
+
+    Returns:
+        typing.Dict[str, typing.Any]: the stage timings, the child's wall
+        time and its peak RSS in KiB.
+    """
+    start = time.perf_counter()
+    with tempfile.TemporaryFile() as errors:
+        # The child is reaped with os.wait4 rather than Popen.wait, which
+        # is what gives its own resource usage.
+        child = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--run-stages",
+             suite, input_path], stdout=subprocess.PIPE, stderr=errors)
+        output = child.stdout.read()
+        child.stdout.close()
+        _, status, usage = os.wait4(child.pid, 0)
+        child.returncode = os.waitstatus_to_exitcode(status)
+        wall_time = time.perf_counter() - start
+        if child.returncode != 0:
+            errors.seek(0)
+            return {"error": errors.read().decode().strip().splitlines()[-1:],
+                    "wall": wall_time}
+    result = {"stages": json.loads(output), "wall": wall_time,
+              "peak_rss_kib": usage.ru_maxrss}
+    if sys.platform == "darwin":
+        result["peak_rss_kib"] //= 1024
+    return result
+
+
+def run_benchmarks(sizes: typing.List[int], suites: typing.List[str],
+                   label_density: float, variable_density: float,
+                   call_density: float, seed: int) \
+        -> typing.List[typing.Dict[str, typing.Any]]:
+    """Generates an input of every size for every suite and measures it.
+
+    Args:
+        sizes (typing.List[int]): input sizes in lines.
+        suites (typing.List[str]): the suites to run, see SUITES.
+        label_density (float): see generate_asm() and generate_vm().
+        variable_density (float): see generate_asm().
+        call_density (float): see generate_vm().
+        seed (int): seed of the generators.
+
+    Returns:
+        typing.List[typing.Dict[str, typing.Any]]: one record per run.
+    """
+    records = []
+    with tempfile.TemporaryDirectory() as directory:
+        for suite in suites:
+            for size in sizes:
+                extension = ".asm" if suite == "assembler" else ".vm"
+                input_path = os.path.join(directory,
+                                          "Bench" + str(size) + extension)
+                with open(input_path, "w") as input_file:
+                    if suite == "assembler":
+                        generate_asm(input_file, size, label_density,
+                                     variable_density, seed)
+                    else:
+                        generate_vm(input_file, size, label_density,
+                                    call_density, seed=seed)
+                record = {"suite": suite, "lines": size}
+                record.update(measure(suite, input_path))
+                os.remove(input_path)
+                records.append(record)
+                print(format_record(record), flush=True)
+    return records
+
+
+def format_record(record: typing.Dict[str, typing.Any]) -> str:
+    """
+    Returns:
+        str: one human readable line for a record.
+    """
+    line = record["suite"].ljust(11) + str(record["lines"]).rjust(9) + \
+        " lines "
+    if "error" in record:
+        return line + "failed: " + " ".join(record["error"])
+    stages = " ".join([name + "=" + format(seconds, ".3f") + "s"
+                       for name, seconds in record["stages"].items()
+                       if isinstance(seconds, float)])
+    return line + stages + " rss=" + str(record["peak_rss_kib"] // 1024) + \
+        "MiB"
+
+
+def compare(records: typing.List[typing.Dict[str, typing.Any]],
+            baseline: typing.List[typing.Dict[str, typing.Any]]) -> None:
+    """Prints the ratio of every stage time to the same stage of a baseline
+    run, so a slowdown (or a quadratic stage) stands out.
+    """
+    old = {(record["suite"], record["lines"]): record for record in baseline}
+    for record in records:
+        previous = old.get((record["suite"], record["lines"]))
+        if previous is None or "stages" not in previous or \
+                "stages" not in record:
+            continue
+        ratios = []
+        for name, seconds in record["stages"].items():
+            before = previous["stages"].get(name)
+            if isinstance(seconds, float) and before:
+                ratios.append(name + "=" + format(seconds / before, ".2f") +
+                              "x")
+        print(record["suite"].ljust(11) + str(record["lines"]).rjust(9) +
+              " lines vs baseline " + " ".join(ratios))
+
+
+if "__main__" == __name__:
+    argument_parser = argparse.ArgumentParser(prog="Benchmark")
+    argument_parser.add_argument(
+        "--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+        help="input sizes in lines")
+    argument_parser.add_argument("--suites", nargs="+", choices=SUITES,
+                                 default=SUITES)
+    argument_parser.add_argument("--label-density", type=float,
+                                 default=0.02)
+    argument_parser.add_argument("--variable-density", type=float,
+                                 default=0.1)
+    argument_parser.add_argument("--call-density", type=float, default=0.05)
+    argument_parser.add_argument("--seed", type=int, default=0)
+    argument_parser.add_argument(
+        "--output", default="bench_results.json",
+        help="machine-readable results file")
+    argument_parser.add_argument(
+        "--compare", metavar="BASELINE",
+        help="a previous results file to compare against")
+    argument_parser.add_argument("--run-stages", nargs=2,
+                                 metavar=("SUITE", "PATH"),
+                                 help=argparse.SUPPRESS)
+    arguments = argument_parser.parse_args()
+    if arguments.run_stages:
+        suite, path = arguments.run_stages
+        json.dump(STAGE_RUNNERS[suite](path), sys.stdout)
+        sys.exit(0)
+
+    results = run_benchmarks(
+        arguments.sizes, arguments.suites, arguments.label_density,
+        arguments.variable_density, arguments.call_density, arguments.seed)
+    with open(arguments.output, "w") as results_file:
+        json.dump({"date": datetime.datetime.now().isoformat(),
+                   "python": platform.python_version(),
+                   "platform": platform.platform(),
+                   "parameters": {
+                       "label_density": arguments.label_density,
+                       "variable_density": arguments.variable_density,
+                       "call_density": arguments.call_density,
+                       "seed": arguments.seed},
+                   "results": results}, results_file, indent=1)
+    if arguments.compare:
+        with open(arguments.compare) as baseline_file:
+            compare(results, json.load(baseline_file)["results"])
@@ -0,0 +1,124 @@
+"""This file is part of nand2tetris, as taught in The Hebrew University,
+and was written by Aviv Yaish according to the specifications given in
+https://www.nand2tetris.org (Shimon Schocken and Noam Nisan, 2017)
+and as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported License (https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import random
+import typing
+
+
+# C-instructions in roughly the proportions the VM translator emits them.
+C_INSTRUCTIONS = ["D=M", "M=D", "A=M", "D=A", "M=M+1", "AM=M-1", "A=M-1",
+                  "D=M-D", "M=M+D", "D;JEQ", "D;JGT", "D;JLT", "0;JMP",
+                  "M = M-1", "D = M", "M=-1", "M=0", "A=A+D", "D=D-1"]
+PREDEFINED_SYMBOLS = ["SP", "LCL", "ARG", "THIS", "THAT", "R13", "R14", "R15"]
+SEGMENTS = ["local", "argument", "this", "that", "temp", "pointer", "static"]
+ARITHMETIC_COMMANDS = ["add", "sub", "neg", "eq", "gt", "lt", "and", "or",
+                       "not"]
+
+
+def generate_asm(output_file: typing.TextIO, lines: int,
+                 label_density: float = 0.02,
+                 variable_density: float = 0.1,
+                 seed: int = 0) -> None:
+    """Writes a synthetic Hack assembly program.
+
+    Args:
+        output_file (typing.TextIO): writes the program to this file.
+        lines (int): the number of lines to write.
+        label_density (float): the fraction of lines that are labels.
+        variable_density (float): the fraction of A-instructions that
+        reference a variable rather than a label, constant or predefined
+        symbol.
+        seed (int): seed of the random generator.
+    """
+    generator = random.Random(seed)
+    label_count = max(1, int(lines * label_density))
+    variable_count = max(1, int(lines * variable_density) // 20)
+    labels_written = 0
+    buffer = []
+    for line_number in range(lines):
+        roll = generator.random()
+        if roll < label_density and labels_written < label_count:
+            buffer.append("(L" + str(labels_written) + ")\n")
+            labels_written += 1
+        elif roll < 0.05:
+            buffer.append("// comment " + str(line_number) + "\n")
+        elif roll < 0.5:
+            kind = generator.random()
+            if kind < variable_density:
+                symbol = "v" + str(generator.randrange(variable_count))
+            elif kind < 0.4:
+                symbol = "L" + str(generator.randrange(label_count))
+            elif kind < 0.7:
+                symbol = generator.choice(PREDEFINED_SYMBOLS)
+            else:
+                symbol = str(generator.randrange(32768))
+            buffer.append("@" + symbol + "\n")
+        else:
+            buffer.append(generator.choice(C_INSTRUCTIONS) + "\n")
+        if len(buffer) >= 8192:
+            output_file.write("".join(buffer))
+            buffer.clear()
+    # Labels the random walk did not place are still referenced.
+    for label in range(labels_written, label_count):
+        buffer.append("(L" + str(label) + ")\n")
+    buffer.append("@L0\n0;JMP\n")
+    output_file.write("".join(buffer))
+
+
+def generate_vm(output_file: typing.TextIO, lines: int,
+                label_density: float = 0.02, call_density: float = 0.05,
+                function_size: int = 200, seed: int = 0) -> None:
+    """Writes a synthetic VM program, made of functions of about
+    function_size commands that push and pop every segment, compute, branch
+    to their own labels and call each other.
+
+    Args:
+        output_file (typing.TextIO): writes the program to this file.
+        lines (int): the number of lines to write.
+        label_density (float): the fraction of commands that are labels,
+        each also targeted by a goto or if-goto.
+        call_density (float): the fraction of commands that are calls.
+        function_size (int): the number of commands per function.
+        seed (int): seed of the random generator.
+    """
+    generator = random.Random(seed)
+    function_count = max(1, lines // function_size)
+    buffer = ["// Synthetic benchmark program\n"]
+    written = 0
+    function_index = 0
+    while written < lines:
+        buffer.append("function Bench.f" + str(function_index) + " " +
+                      str(generator.randrange(4)) + "\n")
+        labels = 0
+        for _ in range(min(function_size, lines - written) - 2):
+            roll = generator.random()
+            if roll < label_density:
+                buffer.append("label L" + str(labels) + "\n")
+                buffer.append(generator.choice(["goto", "if-goto"]) + " L" +
+                              str(generator.randrange(labels + 1)) + "\n")
+                labels += 1
+            elif roll < label_density + call_density:
+                buffer.append("call Bench.f" +
+                              str(generator.randrange(function_count)) +
+                              " " + str(generator.randrange(4)) + "\n")
+            elif roll < 0.45:
+                buffer.append("push constant " +
+                              str(generator.randrange(32768)) + "\n")
+            elif roll < 0.7:
+                buffer.append(generator.choice(["push ", "pop "]) +
+                              generator.choice(SEGMENTS) + " " +
+                              str(generator.randrange(2)) + "\n")
+            elif roll < 0.75:
+                buffer.append("// comment\n")
+            else:
+                buffer.append(generator.choice(ARITHMETIC_COMMANDS) + "\n")
+        buffer.append("return\n")
+        written += min(function_size, lines - written)
+        function_index += 1
+        if len(buffer) >= 8192:
+            output_file.write("".join(buffer))
+            buffer.clear()
+    output_file.write("".join(buffer))
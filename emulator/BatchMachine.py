@@ -0,0 +1,227 @@
+"""This file is part of nand2tetris, as taught in The Hebrew University,
+and was written by Aviv Yaish according to the specifications given in
+https://www.nand2tetris.org (Shimon Schocken and Noam Nisan, 2017)
+and as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported License (https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import typing
+import numpy
+from HackMachine import RAM_SIZE, ROM_SIZE, HackMachine
+
+
+class BatchMachine:
+    """N Hack computers running the same program in lockstep, for sweeping
+    a program over many inputs. Their state is held as NumPy arrays: `A`,
+    `D` and `pc` vectors of N machines and an N x 32K `ram` matrix, and
+    every step executes one instruction on all of them with vectorized ALU
+    operations.
+
+    Machines whose program counters diverge still step together: each one
+    fetches its own instruction, and the results are selected per machine
+    with masks. While all of them are at the same address, which is the
+    common case until their inputs make them branch differently, a step
+    only computes the one instruction they share.
+
+    Unlike HackMachine, memory addresses wrap around at 32K instead of
+    failing.
+    """
+
+    def __init__(self, count: int) -> None:
+        """Creates count machines with zeroed ROM, RAM and registers.
+
+        Args:
+            count (int): the number of machines, N.
+        """
+        self.count = count
+        self.rows = numpy.arange(count)
+        self.ram = numpy.zeros((count, RAM_SIZE), dtype=numpy.uint16)
+        self.A = numpy.zeros(count, dtype=numpy.uint16)
+        self.D = numpy.zeros(count, dtype=numpy.uint16)
+        self.pc = numpy.zeros(count, dtype=numpy.int64)
+        self.cycles = numpy.zeros(count, dtype=numpy.int64)
+        self.load_words([])
+
+    def load_words(self, words: typing.Sequence[int]) -> None:
+        """Replaces the ROM of every machine with the given program and
+        resets them.
+
+        Args:
+            words (typing.Sequence[int]): the program's 16-bit instructions.
+        """
+        if len(words) > ROM_SIZE:
+            raise ValueError("program of " + str(len(words)) +
+                             " words does not fit in ROM")
+        rom = numpy.zeros(ROM_SIZE, dtype=numpy.uint16)
+        rom[:len(words)] = numpy.asarray(words, dtype=numpy.uint16)
+        self.rom = rom
+        # The fields of every instruction, indexed by address.
+        self.is_c = (rom & 0x8000) != 0
+        self.is_shift = self.is_c & ((rom & 0x4000) == 0)
+        self.a_bit = (rom & 0x1000) != 0
+        self.comp = (rom >> 6) & 63
+        self.dest = (rom >> 3) & 7
+        self.jump = rom & 7
+        self.reset()
+
+    def load(self, path: str) -> None:
+        """Loads a program from any file HackMachine.load() accepts.
+
+        Args:
+            path (str): the program file.
+        """
+        machine = HackMachine()
+        machine.load(path)
+        self.load_words(machine.rom[:machine.program_size])
+
+    def reset(self) -> None:
+        """Resets every program counter and cycle count. RAM and the A and D
+        registers are kept."""
+        self.pc[:] = 0
+        self.cycles[:] = 0
+
+    def run(self, cycles: int,
+            active: typing.Optional[numpy.ndarray] = None) -> None:
+        """Executes instructions on every machine, one per clock cycle.
+
+        Args:
+            cycles (int): the number of cycles to run.
+            active (typing.Optional[numpy.ndarray]): a boolean mask of the
+            machines to run, all of them by default. The others keep
+            their state.
+        """
+        for _ in range(cycles):
+            self.step(active)
+
+    def run_until(self, address: int, max_cycles: int) -> numpy.ndarray:
+        """Runs every machine until it reaches address, such as the halting
+        loop at the end of a program, or until max_cycles have run.
+
+        Args:
+            address (int): the ROM address to stop at.
+            max_cycles (int): the most cycles to run any machine for.
+
+        Returns:
+            numpy.ndarray: the cycle at which each machine reached address,
+            or -1 for those that did not.
+        """
+        reached = numpy.full(self.count, -1, dtype=numpy.int64)
+        for _ in range(max_cycles):
+            arrived = (self.pc == address) & (reached < 0)
+            reached[arrived] = self.cycles[arrived]
+            active = reached < 0
+            if not active.any():
+                break
+            self.step(active)
+        arrived = (self.pc == address) & (reached < 0)
+        reached[arrived] = self.cycles[arrived]
+        return reached
+
+    def step(self, active: typing.Optional[numpy.ndarray] = None) -> None:
+        """Executes one instruction on every machine.
+
+        Args:
+            active (typing.Optional[numpy.ndarray]): a boolean mask of the
+            machines to run, all of them by default.
+        """
+        pc = self.pc
+        if active is None or active.all():
+            first = pc[0]
+            if (pc == first).all():
+                self._step_shared(int(first))
+                return
+            active = numpy.ones(self.count, dtype=bool)
+        a_register = self.A
+        d_register = self.D
+        is_c = self.is_c[pc]
+        is_shift = self.is_shift[pc]
+        comp = self.comp[pc]
+        dest = numpy.where(is_c & active, self.dest[pc], 0)
+        jump = numpy.where(is_c, self.jump[pc], 0)
+        addresses = a_register & (RAM_SIZE - 1)
+        memory = self.ram[self.rows, addresses]
+        y = numpy.where(self.a_bit[pc], memory, a_register)
+        out = _alu(comp, d_register, y)
+        operand = numpy.where((comp & 16) != 0, d_register, y)
+        shifted = numpy.where(
+            (comp & 32) != 0, operand << numpy.uint16(1),
+            (operand >> numpy.uint16(1)) | (operand & numpy.uint16(0x8000)))
+        out = numpy.where(is_shift, shifted, out)
+
+        taken = _jump_taken(jump, out)
+        writes_m = (dest & 1) != 0
+        self.ram[self.rows[writes_m], addresses[writes_m]] = out[writes_m]
+        self.D = numpy.where((dest & 2) != 0, out, d_register)
+        new_a = numpy.where((dest & 4) != 0, out, a_register)
+        self.A = numpy.where(active & ~is_c, self.rom[pc], new_a)
+        self.pc = numpy.where(
+            active, numpy.where(taken, a_register & 0x7FFF, (pc + 1) & 0x7FFF),
+            pc)
+        self.cycles += active
+
+    def _step_shared(self, address: int) -> None:
+        """Executes the instruction at address on every machine."""
+        word = int(self.rom[address])
+        self.cycles += 1
+        if not word & 0x8000:
+            self.A[:] = word
+            self.pc[:] = (address + 1) & 0x7FFF
+            return
+        a_register = self.A
+        comp = (word >> 6) & 63
+        dest = (word >> 3) & 7
+        jump = word & 7
+        if word & 0x1000:
+            addresses = a_register & (RAM_SIZE - 1)
+            y = self.ram[self.rows, addresses]
+        else:
+            y = a_register
+        if word & 0x4000:
+            out = _alu(comp, self.D, y)
+        else:
+            operand = self.D if comp & 16 else y
+            out = operand << numpy.uint16(1) if comp & 32 else \
+                (operand >> numpy.uint16(1)) | (operand & numpy.uint16(0x8000))
+        if dest & 1:
+            self.ram[self.rows, a_register & (RAM_SIZE - 1)] = out
+        if dest & 2:
+            self.D = out.copy()
+        if dest & 4:
+            self.A = out.copy()
+        if jump == 7:
+            self.pc[:] = a_register & 0x7FFF
+        elif jump:
+            self.pc = numpy.where(_jump_taken(jump, out), a_register & 0x7FFF,
+                                  (address + 1) & 0x7FFF)
+        else:
+            self.pc[:] = (address + 1) & 0x7FFF
+
+
+def _alu(comp: typing.Union[int, numpy.ndarray], x: numpy.ndarray,
+         y: numpy.ndarray) -> numpy.ndarray:
+    """The Hack ALU on uint16 vectors, for one control setting shared by
+    every machine or for one setting per machine."""
+    zx, nx, zy, ny, f, no = [((comp >> bit) & 1) != 0
+                             for bit in range(5, -1, -1)]
+    if isinstance(comp, int):
+        x = numpy.zeros_like(x) if zx else x
+        x = ~x if nx else x
+        y = numpy.zeros_like(y) if zy else y
+        y = ~y if ny else y
+        out = x + y if f else x & y
+        return ~out if no else out
+    zero = numpy.uint16(0)
+    x = numpy.where(zx, zero, x)
+    x = numpy.where(nx, ~x, x)
+    y = numpy.where(zy, zero, y)
+    y = numpy.where(ny, ~y, y)
+    out = numpy.where(f, x + y, x & y)
+    return numpy.where(no, ~out, out)
+
+
+def _jump_taken(jump: typing.Union[int, numpy.ndarray],
+                out: numpy.ndarray) -> numpy.ndarray:
+    """Evaluates the jump bits against the ALU output of every machine."""
+    negative = out >= 0x8000
+    zero = out == 0
+    return ((jump & 4) != 0) & negative | ((jump & 2) != 0) & zero | \
+        ((jump & 1) != 0) & ~negative & ~zero
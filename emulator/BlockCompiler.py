@@ -0,0 +1,265 @@
+"""This file is part of nand2tetris, as taught in The Hebrew University,
+and was written by Aviv Yaish according to the specifications given in
+https://www.nand2tetris.org (Shimon Schocken and Noam Nisan, 2017)
+and as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported License (https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import collections
+import typing
+from HackMachine import A_INSTRUCTION, C_INSTRUCTION, ROM_SIZE, \
+    HackMachine, alu_expression
+from Profiler import Profile
+
+
+# A compiled block takes (ram, A, D, budget) and returns the new
+# (A, D, PC) and the number of instructions it executed.
+Block = typing.Tuple[typing.Callable[[typing.Any, int, int, int],
+                                     typing.Tuple[int, int, int, int]], int]
+
+MAX_BLOCK_LENGTH = 256
+
+# The jump condition of every jump field but JMP, on the ALU output.
+JUMP_CONDITIONS = {1: "0 < out < 0x8000", 2: "out == 0", 3: "out < 0x8000",
+                   4: "out >= 0x8000", 5: "out != 0",
+                   6: "out == 0 or out >= 0x8000"}
+
+# Compiled blocks of the last ROMs loaded, by ROM hash and then by entry
+# address, least recently loaded first. A machine keeps its own table
+# alive after it is evicted.
+BLOCK_CACHE_SIZE = 8
+_BLOCK_CACHE = collections.OrderedDict()
+
+
+def cached_block_table(key: bytes) -> typing.List[typing.Optional[Block]]:
+    """
+    Args:
+        key (bytes): the ROM hash, followed by anything else the blocks
+        depend on.
+
+    Returns:
+        typing.List[typing.Optional[Block]]: the shared table of compiled
+        blocks for the key, by entry address.
+    """
+    table = _BLOCK_CACHE.get(key)
+    if table is None:
+        table = _BLOCK_CACHE[key] = [None] * ROM_SIZE
+        if len(_BLOCK_CACHE) > BLOCK_CACHE_SIZE:
+            _BLOCK_CACHE.popitem(last=False)
+    else:
+        _BLOCK_CACHE.move_to_end(key)
+    return table
+
+
+def compile_block(decoded: typing.List[typing.Tuple[int, ...]],
+                  start: int, profile: typing.Optional[Profile] = None,
+                  stops: typing.Container[int] = (),
+                  loop_at_stops: bool = False) -> Block:
+    """Compiles the straight-line code at start into one Python function.
+    Jumps may land anywhere, so blocks are compiled for whatever entry
+    addresses execution reaches, and a block can overlap another.
+
+    The block ends at the first jump whose target is not a constant, and
+    leaves through conditional jumps as they are taken. It follows
+    unconditional jumps to constant addresses, and a jump back to its own
+    start becomes a loop inside the function, which keeps iterating while
+    another full pass fits in the budget. Inside the block, an A register
+    that was just loaded with a constant is folded into the code that
+    reads it. An access to M through a computed A that points past the end
+    of RAM leaves the block just before that instruction, having executed
+    nothing if it is the first, so the interpreter reports it.
+
+    Args:
+        decoded (typing.List[typing.Tuple[int, ...]]): the decoded ROM, see
+        HackMachine.decoded.
+        start (int): the entry address.
+        profile (typing.Optional[Profile]): when given, the block counts
+        every way it is left in this profile.
+        stops (typing.Container[int]): addresses the block ends at, whether
+        it jumps or falls through to them, so that the caller sees every
+        arrival there.
+        loop_at_stops (bool): whether a block that starts at a stop still
+        loops back to its start without returning, so that the caller only
+        sees it entered.
+
+    Returns:
+        Block: the function and the most instructions one pass through it
+        executes, which is also the least budget it may be called with.
+    """
+    lines = ["def block(ram, a, d, budget):", "    n = 0", "    while True:"]
+    indent = "        "
+    # The constant held by A, if it is known at this point of the block.
+    known_a = None
+    address = start
+    count = 0
+    ended = False
+    # The addresses executed so far, for the profile.
+    path = []
+
+    def count_exit(body: str,
+                   executed: typing.Optional[int] = None) -> None:
+        if profile is not None:
+            lines.append(body + "exits[" + str(profile.add_site(
+                path[:executed])) + "] += 1")
+
+    while not ended:
+        kind, value, a_bit, comp, dest, jump = decoded[address]
+        path.append(address)
+        address += 1
+        count += 1
+        if kind == A_INSTRUCTION:
+            known_a = value
+        else:
+            a = "a" if known_a is None else str(known_a)
+            memory = "ram[" + a + "]"
+            reads_memory = a_bit and (kind == C_INSTRUCTION or
+                                      not comp & 16)
+            if known_a is None and (reads_memory or dest & 1):
+                lines.append(indent + "if a > 0x7FFF:")
+                count_exit(indent + "    ", count - 1)
+                lines.append(indent + "    return a, d, " +
+                             str(address - 1) + ", n + " + str(count - 1))
+            if kind == C_INSTRUCTION:
+                out = alu_expression(comp, "d", memory if a_bit else a)
+            else:
+                operand = "d" if comp & 16 else memory if a_bit else a
+                lines.append(indent + "v = " + operand)
+                out = "((v << 1) & 0xFFFF)" if comp & 32 else \
+                    "((v >> 1) | (v & 0x8000))"
+            # A jump goes to the value A had before this instruction.
+            target = None if known_a is None else known_a & 0x7FFF
+            if not jump and dest in (1, 2, 4):
+                # A single destination takes the value directly.
+                lines.append(indent + {1: memory, 2: "d", 4: "a"}[dest] +
+                             " = " + out)
+            else:
+                lines.append(indent + "out = " + out)
+                if dest & 1:
+                    lines.append(indent + memory + " = out")
+                if dest & 2:
+                    lines.append(indent + "d = out")
+                if dest & 4 and jump and target is None:
+                    lines.append(indent + "t = a")
+                if dest & 4:
+                    lines.append(indent + "a = out")
+            if dest & 4:
+                known_a = None
+            a = "a" if known_a is None else str(known_a)
+            body = indent
+            if jump and jump != 7:
+                lines.append(indent + "if " + JUMP_CONDITIONS[jump] + ":")
+                body += "    "
+            if jump and target is None:
+                count_exit(body)
+                lines.append(body + "return " + a + ", d, " +
+                             ("t" if dest & 4 else "a") + " & 0x7FFF, n + " +
+                             str(count))
+                ended = jump == 7
+            elif jump and target == start and (loop_at_stops or
+                                               start not in stops):
+                count_exit(body)
+                lines.append(body + "n += " + str(count))
+                lines.append(body + "if budget - n >= LENGTH:")
+                if known_a is not None:
+                    lines.append(body + "    a = " + a)
+                lines.append(body + "    continue")
+                lines.append(body + "return " + a + ", d, " + str(start) +
+                             ", n")
+                ended = jump == 7
+            elif jump == 7 and count < MAX_BLOCK_LENGTH and \
+                    target not in stops:
+                address = target
+                continue
+            elif jump:
+                count_exit(body)
+                lines.append(body + "return " + a + ", d, " + str(target) +
+                             ", n + " + str(count))
+                ended = jump == 7
+        if not ended and (address == ROM_SIZE or count == MAX_BLOCK_LENGTH
+                          or address in stops):
+            a = "a" if known_a is None else str(known_a)
+            count_exit(indent)
+            lines.append(indent + "return " + a + ", d, " +
+                         str(address % ROM_SIZE) + ", n + " + str(count))
+            ended = True
+    namespace = {"LENGTH": count,
+                 "exits": None if profile is None else profile.site_counts}
+    exec(compile("\n".join(lines) + "\n", "<block " + str(start) + ">",
+                 "exec"), namespace)
+    return namespace["block"], count
+
+
+class CompiledMachine(HackMachine):
+    """A HackMachine that runs compiled basic blocks instead of
+    interpreting one instruction at a time. Blocks are compiled the first
+    time execution enters them and kept per ROM contents, for the last
+    BLOCK_CACHE_SIZE programs loaded, so reloading the same program reuses
+    them.
+
+    Cycle counts stay exact: a block runs only while it fits in the cycles
+    left, and the remainder is interpreted.
+
+    With profiling on, `profile` counts how often every address runs. The
+    counting blocks belong to that profile, so they are not shared, except
+    with forks of the machine, which count into the same profile.
+    """
+
+    def __init__(self, profile: bool = False) -> None:
+        """Creates a machine with zeroed ROM, RAM and registers.
+
+        Args:
+            profile (bool): count the executions of every address.
+        """
+        self.profile = Profile() if profile else None
+        super().__init__()
+        self.blocks = self._block_table()
+
+    def load_words(self, words: typing.Sequence[int]) -> None:
+        """Replaces the ROM with the given program and resets the machine.
+
+        Args:
+            words (typing.Sequence[int]): the program's 16-bit instructions.
+        """
+        super().load_words(words)
+        self.blocks = self._block_table()
+
+    def _block_table(self) -> typing.List[typing.Optional[Block]]:
+        if self.profile is not None:
+            self.profile = Profile()
+            return [None] * ROM_SIZE
+        return cached_block_table(self.rom_hash())
+
+    def run(self, cycles: int) -> None:
+        """Executes instructions, one per clock cycle.
+
+        Args:
+            cycles (int): the number of cycles to run.
+        """
+        blocks = self.blocks
+        decoded = self.decoded
+        ram = self.ram
+        a_register, d_register = self.A, self.D
+        pc = self.pc % ROM_SIZE
+        remaining = cycles
+        while remaining:
+            block = blocks[pc]
+            if block is None:
+                block = blocks[pc] = compile_block(decoded, pc,
+                                                   self.profile)
+            function, length = block
+            if length > remaining:
+                break
+            a_register, d_register, pc, executed = function(
+                ram, a_register, d_register, remaining)
+            if not executed:
+                # An access past the end of RAM, left to the interpreter.
+                break
+            remaining -= executed
+        self.A, self.D, self.pc = a_register, d_register, pc
+        self.cycles += cycles - remaining
+        if remaining and self.profile is None:
+            HackMachine.run(self, remaining)
+        elif remaining:
+            interpreted = self.profile.interpreted
+            for _ in range(remaining):
+                interpreted[self.pc % ROM_SIZE] += 1
+                HackMachine.run(self, 1)
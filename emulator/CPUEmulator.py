@@ -0,0 +1,111 @@
+"""This file is part of nand2tetris, as taught in The Hebrew University,
+and was written by Aviv Yaish according to the specifications given in
+https://www.nand2tetris.org (Shimon Schocken and Noam Nisan, 2017)
+and as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported License (https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import argparse
+import os
+import sys
+import time
+import typing
+from BlockCompiler import CompiledMachine
+from FastForward import FastForwardMachine
+from FlameGraph import FOLDED_EXTENSION, CallStackMachine
+from HackMachine import HackMachine
+from TestScript import TestScript
+
+
+def run_script(script_path: str, machine: HackMachine) \
+        -> typing.Tuple[typing.Optional[str], int, float]:
+    """Runs one test script.
+
+    Args:
+        script_path (str): the .tst file.
+        machine (HackMachine): the machine to run it on.
+
+    Returns:
+        typing.Tuple[typing.Optional[str], int, float]: the comparison
+        failure or None, the number of cycles run and the seconds taken.
+    """
+    start = time.perf_counter()
+    script = TestScript(script_path, machine)
+    failure = script.run()
+    return failure, script.machine.cycles, time.perf_counter() - start
+
+
+if "__main__" == __name__:
+    # Runs every test script given, or every CPU test script in a directory
+    argument_parser = argparse.ArgumentParser(prog="CPUEmulator")
+    argument_parser.add_argument("script_paths", nargs="+")
+    argument_parser.add_argument(
+        "--stats", action="store_true",
+        help="print the cycles run and the time taken by each script")
+    argument_parser.add_argument(
+        "--interpret", action="store_true",
+        help="interpret instructions one at a time instead of compiling "
+             "basic blocks")
+    argument_parser.add_argument(
+        "--profile", action="store_true",
+        help="count the executions of every ROM address and print where "
+             "the cycles went, by label and by VM command")
+    argument_parser.add_argument(
+        "--flame-graph", action="store_true",
+        help="follow the VM call stack and write the cycles of every call "
+             "chain to a " + FOLDED_EXTENSION + " file next to each script, "
+             "in the collapsed-stack format of flame graph tools")
+    argument_parser.add_argument(
+        "--fast-forward", action="store_true",
+        help="skip loops that spin without changing the machine's state, "
+             "such as keyboard polling and the final infinite loop")
+    arguments = argument_parser.parse_args()
+    if arguments.interpret and (arguments.profile or arguments.flame_graph or
+                                arguments.fast_forward):
+        argument_parser.error("--profile, --flame-graph and --fast-forward "
+                              "need compiled basic blocks")
+    if arguments.profile + arguments.flame_graph + \
+            arguments.fast_forward > 1:
+        argument_parser.error("--profile, --flame-graph and --fast-forward "
+                              "cannot be combined")
+    scripts = []
+    for argument_path in arguments.script_paths:
+        argument_path = os.path.abspath(argument_path)
+        if os.path.isdir(argument_path):
+            # The VME scripts are for the VM emulator, not the CPU.
+            scripts.extend(
+                os.path.join(argument_path, filename)
+                for filename in sorted(os.listdir(argument_path))
+                if filename.endswith(".tst") and
+                not filename.endswith("VME.tst"))
+        else:
+            scripts.append(argument_path)
+    failed = False
+    for script_path in scripts:
+        if arguments.interpret:
+            machine = HackMachine()
+        elif arguments.flame_graph:
+            machine = CallStackMachine()
+        elif arguments.fast_forward:
+            machine = FastForwardMachine()
+        else:
+            machine = CompiledMachine(arguments.profile)
+        try:
+            failure, cycles, seconds = run_script(script_path, machine)
+        except Exception as error:
+            failure, cycles, seconds = repr(error), 0, 0.0
+        failed = failed or failure is not None
+        message = failure if failure is not None else \
+            "End of script - Comparison ended successfully"
+        if arguments.stats:
+            message += " (" + str(cycles) + " cycles in " + \
+                format(seconds * 1000, ".1f") + "ms)"
+        print(script_path + ": " + message,
+              file=sys.stderr if failure is not None else sys.stdout)
+        if arguments.profile and machine.cycles:
+            print(machine.profile.report(machine.listing))
+        if arguments.flame_graph and machine.cycles:
+            with open(os.path.splitext(script_path)[0] + FOLDED_EXTENSION,
+                      "w") as folded_file:
+                machine.write_folded(folded_file)
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,468 @@
+"""This file is part of nand2tetris, as taught in The Hebrew University,
+and was written by Aviv Yaish according to the specifications given in
+https://www.nand2tetris.org (Shimon Schocken and Noam Nisan, 2017)
+and as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported License (https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import typing
+from BlockCompiler import Block, CompiledMachine, cached_block_table, \
+    compile_block
+from HackMachine import A_INSTRUCTION, ALU, C_INSTRUCTION, RAM_SIZE, \
+    ROM_SIZE, WRAP, HackMachine, is_jump_taken, to_signed
+
+
+# The most cycles a block may run before control comes back to run(), so
+# that a loop inside one compiled block is checked too.
+CHUNK_CYCLES = 4096
+# The most arrivals at a loop head between two checks of it.
+MAX_CHECK_INTERVAL = 256
+# The longest loop iteration that is traced, in cycles.
+MAX_TRACE_CYCLES = 1024
+
+# The registers, among the RAM addresses a loop iteration reads and writes.
+A_LOCATION = -1
+D_LOCATION = -2
+
+# A value computed by a countdown loop from its counter x: (k, c) stands
+# for k * x + c, modulo 2^16.
+Affine = typing.Tuple[int, int]
+Countdown = typing.Tuple[int, typing.Optional[int], typing.Dict[int, Affine],
+                         int]
+
+
+def loop_head_addresses(decoded: typing.List[typing.Tuple[int, ...]],
+                        program_size: int) -> typing.Set[int]:
+    """
+    Args:
+        decoded (typing.List[typing.Tuple[int, ...]]): the decoded ROM, see
+        HackMachine.decoded.
+        program_size (int): the number of words in the program.
+
+    Returns:
+        typing.Set[int]: the targets of the backward jumps to constant
+        addresses, which are the heads of the program's loops.
+    """
+    heads = set()
+    for address in range(1, program_size):
+        kind, _, _, _, _, jump = decoded[address]
+        previous_kind, target = decoded[address - 1][:2]
+        if jump and kind != A_INSTRUCTION and \
+                previous_kind == A_INSTRUCTION and target <= address:
+            heads.add(target)
+    return heads
+
+
+def _affine_not(value: Affine) -> Affine:
+    # !v == -v - 1 for 16-bit values.
+    return (-value[0]) & 0xFFFF, (-value[1] - 1) & 0xFFFF
+
+
+def affine_alu(control: int, x: Affine,
+               y: Affine) -> typing.Optional[Affine]:
+    """
+    Args:
+        control (int): the ALU's six control bits (zx, nx, zy, ny, f, no).
+        x (Affine): the x input, D.
+        y (Affine): the y input, A or M.
+
+    Returns:
+        typing.Optional[Affine]: the ALU output, or None when it is not an
+        affine function of the counter, as x & y of two values that depend
+        on it.
+    """
+    if control & 32:
+        x = (0, 0)
+    if control & 16:
+        x = _affine_not(x)
+    if control & 8:
+        y = (0, 0)
+    if control & 4:
+        y = _affine_not(y)
+    if control & 2:
+        out = (x[0] + y[0]) & 0xFFFF, (x[1] + y[1]) & 0xFFFF
+    elif not x[0] and not y[0]:
+        out = 0, x[1] & y[1]
+    elif x == (0, 0) or y == (0, 0):
+        out = 0, 0
+    elif x == (0, 0xFFFF):
+        out = y
+    elif y == (0, 0xFFFF):
+        out = x
+    else:
+        return None
+    if control & 1:
+        out = _affine_not(out)
+    return out
+
+
+def passes_in_region(value: int, delta: int) -> int:
+    """
+    Args:
+        value (int): a signed 16-bit value a jump tests.
+        delta (int): the signed change of the value in every pass, not 0.
+
+    Returns:
+        int: the number of the first pass in which the value is no longer
+        of the same sign, or no longer 0, counting the current pass as 0.
+    """
+    if value == 0:
+        return 1
+    if value > 0 and delta < 0:
+        return -(value // delta)
+    if value > 0:
+        return (0x7FFF - value) // delta + 1
+    if delta > 0:
+        return -(value // delta)
+    return (value + 0x8000) // -delta + 1
+
+
+class FastForwardMachine(CompiledMachine):
+    """A CompiledMachine that skips the passes of loops it can predict:
+    loops that can no longer change the machine's state, such as keyboard
+    polling and the final infinite loop of a program, and loops that
+    count a value down or up to an exit, such as Sys.wait.
+
+    The targets of backward jumps are loop heads, and compiled blocks end
+    there. Now and then, on arriving at a loop head, the machine traces one
+    pass around the loop, recording the registers and RAM cells the pass
+    reads before writing them: only these carry state from one pass to the
+    next, so only these are compared, rather than all of RAM.
+
+    When none of them changed, every later pass repeats this one, since
+    the program can only see the outside world through RAM, and as many
+    whole passes as fit in the cycles left are skipped at once.
+
+    When exactly one of them changed, the counter, the next pass is
+    evaluated symbolically, with every value an affine function of the
+    counter. If the pass only depends on the counter through affine
+    arithmetic, leaves the other values it reads as they were and moves
+    the counter by a fixed step, the values its jumps test move by fixed
+    steps too. The pass at which the first of them changes sign ends the
+    repetition, so all the passes before it are skipped exactly, and the
+    state they leave is computed from the counter's last value.
+
+    The rest runs normally, so the RAM and the cycle count end up exactly
+    as if every cycle had run. Input only arrives between calls to run():
+    a program polling KBD is skipped to the end of the run, which a caller
+    feeding keys ends at the next key event.
+    """
+
+    def __init__(self) -> None:
+        """Creates a machine with zeroed ROM, RAM and registers."""
+        self.loop_heads = set()
+        # The check state of every loop head: [arrivals left until the next
+        # check, interval between checks].
+        self.loop_checks = {}
+        self.skipped_cycles = 0
+        super().__init__()
+
+    def load_words(self, words: typing.Sequence[int]) -> None:
+        """Replaces the ROM with the given program and resets the machine.
+
+        Args:
+            words (typing.Sequence[int]): the program's 16-bit instructions.
+        """
+        super().load_words(words)
+        self.loop_heads = loop_head_addresses(self.decoded,
+                                              self.program_size)
+        self.loop_checks = {}
+        self.skipped_cycles = 0
+
+    def _block_table(self) -> typing.List[typing.Optional[Block]]:
+        # Blocks that end at loop heads differ from the shared ones.
+        return cached_block_table(self.rom_hash() + b"loop heads")
+
+    def fork(self) -> "FastForwardMachine":
+        """Starts a child run from the current state, see HackMachine.fork().
+
+        Returns:
+            FastForwardMachine: the child machine.
+        """
+        child = super().fork()
+        child.loop_checks = {}
+        return child
+
+    def run(self, cycles: int) -> None:
+        """Executes instructions, one per clock cycle, skipping the passes
+        of loops that can be predicted.
+
+        Args:
+            cycles (int): the number of cycles to run.
+        """
+        blocks = self.blocks
+        decoded = self.decoded
+        ram = self.ram
+        loop_heads = self.loop_heads
+        loop_checks = self.loop_checks
+        a_register, d_register = self.A, self.D
+        pc = self.pc % ROM_SIZE
+        remaining = cycles
+        while remaining:
+            if pc in loop_heads:
+                check = loop_checks.get(pc)
+                if check is None:
+                    check = loop_checks[pc] = [1, 1]
+                check[0] -= 1
+                if check[0] <= 0:
+                    self.A, self.D, self.pc = a_register, d_register, pc
+                    used, skipped = self._check_loop(remaining)
+                    a_register, d_register, pc = self.A, self.D, self.pc
+                    remaining -= used
+                    self.skipped_cycles += skipped
+                    if skipped:
+                        check[1] = 1
+                    elif remaining:
+                        check[1] = min(2 * check[1], MAX_CHECK_INTERVAL)
+                    check[0] = check[1]
+                    if used:
+                        continue
+            block = blocks[pc]
+            if block is None:
+                block = blocks[pc] = compile_block(
+                    decoded, pc, stops=loop_heads, loop_at_stops=True)
+            function, length = block
+            if length > remaining:
+                break
+            a_register, d_register, pc, executed = function(
+                ram, a_register, d_register, min(remaining, CHUNK_CYCLES))
+            if not executed:
+                break
+            remaining -= executed
+        self.A, self.D, self.pc = a_register, d_register, pc
+        self.cycles += cycles - remaining
+        if remaining:
+            HackMachine.run(self, remaining)
+
+    def _check_loop(self, limit: int) -> typing.Tuple[int, int]:
+        """Traces one pass around the loop whose head the machine is at,
+        then skips the passes that follow it, if they can be predicted.
+
+        Args:
+            limit (int): the most cycles to run.
+
+        Returns:
+            typing.Tuple[int, int]: the cycles used, and how many of them
+            were skipped.
+        """
+        head = self.pc
+        executed, live_in = self._trace(min(limit, MAX_TRACE_CYCLES))
+        if self.pc != head or not executed:
+            return executed, 0
+        changed = [location for location, value in live_in.items()
+                   if self._value_at(location) != value]
+        left = limit - executed
+        if not changed:
+            skipped = left - left % executed
+            return executed + skipped, skipped
+        if len(changed) != 1 or changed[0] == A_LOCATION:
+            return executed, 0
+        counter = changed[0]
+        countdown = self._countdown(counter, min(left, MAX_TRACE_CYCLES))
+        if countdown is None:
+            return executed, 0
+        period, passes, values, step = countdown
+        passes = left // period if passes is None else \
+            min(passes, left // period)
+        if not passes:
+            return executed, 0
+        # Every value is the one the last pass computes.
+        last = (self._value_at(counter) + (passes - 1) * step) & 0xFFFF
+        for location, (k, c) in values.items():
+            value = (k * last + c) & 0xFFFF
+            if location == A_LOCATION:
+                self.A = value
+            elif location == D_LOCATION:
+                self.D = value
+            else:
+                self.ram[location] = value
+        skipped = passes * period
+        return executed + skipped, skipped
+
+    def _value_at(self, location: int) -> int:
+        if location == A_LOCATION:
+            return self.A
+        if location == D_LOCATION:
+            return self.D
+        return self.ram[location]
+
+    def _trace(self, limit: int) -> typing.Tuple[int, typing.Dict[int, int]]:
+        """Runs the machine until it is back at the current address, or
+        before an access past the end of RAM, recording what it reads.
+
+        Args:
+            limit (int): the most cycles to run.
+
+        Returns:
+            typing.Tuple[int, typing.Dict[int, int]]: the cycles run, and
+            the value of every location read before it was written.
+        """
+        decoded = self.decoded
+        ram = self.ram
+        alu = ALU
+        a_register, d_register, pc = self.A, self.D, self.pc
+        head = pc
+        live_in = {}
+        written = set()
+        executed = 0
+        while executed < limit:
+            kind, value, a_bit, comp, dest, jump = decoded[pc]
+            if kind == A_INSTRUCTION:
+                a_register = value
+                written.add(A_LOCATION)
+                pc += 1
+                executed += 1
+            elif kind == WRAP:
+                pc = 0
+            else:
+                if kind == C_INSTRUCTION:
+                    uses_x, uses_y = not comp & 32, not comp & 8
+                    reads_memory = a_bit
+                else:
+                    uses_x = comp & 16
+                    uses_y = not uses_x
+                    reads_memory = a_bit and uses_y
+                if (dest & 1 or jump or reads_memory or uses_y) and \
+                        A_LOCATION not in written:
+                    live_in.setdefault(A_LOCATION, a_register)
+                if uses_x and D_LOCATION not in written:
+                    live_in.setdefault(D_LOCATION, d_register)
+                if (reads_memory or dest & 1) and a_register >= RAM_SIZE:
+                    break
+                if reads_memory:
+                    if a_register not in written:
+                        live_in.setdefault(a_register, ram[a_register])
+                    y = ram[a_register]
+                else:
+                    y = a_register
+                if kind == C_INSTRUCTION:
+                    out = alu[comp](d_register, y)
+                else:
+                    operand = d_register if uses_x else y
+                    out = (operand << 1) & 0xFFFF if comp & 32 else \
+                        (operand >> 1) | (operand & 0x8000)
+                target = a_register
+                if dest & 1:
+                    ram[a_register] = out
+                    written.add(a_register)
+                if dest & 2:
+                    d_register = out
+                    written.add(D_LOCATION)
+                if dest & 4:
+                    a_register = out
+                    written.add(A_LOCATION)
+                executed += 1
+                if jump and is_jump_taken(jump, out):
+                    pc = target & 0x7FFF
+                else:
+                    pc += 1
+            if pc == head:
+                break
+        self.A, self.D, self.pc = a_register, d_register, pc
+        return executed, live_in
+
+    def _countdown(self, counter: int,
+                   limit: int) -> typing.Optional[Countdown]:
+        """Evaluates the next pass around the loop whose head the machine
+        is at symbolically, as affine functions of the counter, without
+        running it.
+
+        Args:
+            counter (int): the location of the counter.
+            limit (int): the most cycles the pass may take.
+
+        Returns:
+            typing.Optional[Countdown]: None unless the pass is a countdown,
+            see the class. Otherwise its cycles, the number of passes that
+            repeat it, or None if all do, the value it leaves in every
+            location it reads or writes, and the counter's step.
+        """
+        decoded = self.decoded
+        x = self._value_at(counter)
+        pc = head = self.pc
+        # The value of every location the pass read or wrote so far, and of
+        # those it read before writing them, when the pass started.
+        values = {}
+        initial = {}
+
+        def read(location: int) -> Affine:
+            value = values.get(location)
+            if value is None:
+                value = (1, 0) if location == counter else \
+                    (0, self._value_at(location))
+                values[location] = initial[location] = value
+            return value
+
+        conditions = []
+        executed = 0
+        while executed < limit:
+            kind, value, a_bit, comp, dest, jump = decoded[pc]
+            if kind == A_INSTRUCTION:
+                values[A_LOCATION] = (0, value)
+                pc += 1
+                executed += 1
+            elif kind == WRAP:
+                pc = 0
+            else:
+                if kind == C_INSTRUCTION:
+                    uses_x, uses_y = not comp & 32, not comp & 8
+                    reads_memory = a_bit
+                else:
+                    uses_x = comp & 16
+                    uses_y = not uses_x
+                    reads_memory = a_bit and uses_y
+                a_value = read(A_LOCATION) if \
+                    dest & 1 or jump or reads_memory or uses_y else (0, 0)
+                if (reads_memory or dest & 1) and \
+                        (a_value[0] or a_value[1] >= RAM_SIZE):
+                    return None
+                y = read(a_value[1]) if reads_memory else a_value
+                d_value = read(D_LOCATION) if uses_x else (0, 0)
+                if kind == C_INSTRUCTION:
+                    out = affine_alu(comp, d_value, y)
+                    if out is None:
+                        return None
+                else:
+                    operand = d_value if uses_x else y
+                    if comp & 32:
+                        out = (2 * operand[0]) & 0xFFFF, \
+                            (2 * operand[1]) & 0xFFFF
+                    elif operand[0]:
+                        return None
+                    else:
+                        out = 0, (operand[1] >> 1) | (operand[1] & 0x8000)
+                if dest & 1:
+                    values[a_value[1]] = out
+                if dest & 2:
+                    values[D_LOCATION] = out
+                if dest & 4:
+                    values[A_LOCATION] = out
+                executed += 1
+                if jump != 7 and jump and out[0]:
+                    conditions.append(out)
+                if jump and is_jump_taken(jump,
+                                          (out[0] * x + out[1]) & 0xFFFF):
+                    if a_value[0]:
+                        return None
+                    pc = a_value[1] & 0x7FFF
+                else:
+                    pc += 1
+            if pc == head:
+                break
+        if pc != head or counter not in initial:
+            return None
+        step_factor, step = values[counter]
+        if step_factor != 1 or not step:
+            return None
+        if any(values[location] != value
+               for location, value in initial.items()
+               if location != counter):
+            return None
+        passes = None
+        for k, c in conditions:
+            delta = to_signed((k * step) & 0xFFFF)
+            if delta:
+                first_change = passes_in_region(
+                    to_signed((k * x + c) & 0xFFFF), delta)
+                passes = first_change if passes is None else \
+                    min(passes, first_change)
+        return executed, passes, values, step
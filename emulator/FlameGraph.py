@@ -0,0 +1,187 @@
+"""This file is part of nand2tetris, as taught in The Hebrew University,
+and was written by Aviv Yaish according to the specifications given in
+https://www.nand2tetris.org (Shimon Schocken and Noam Nisan, 2017)
+and as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported License (https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import typing
+from BlockCompiler import CompiledMachine, compile_block
+from HackMachine import ROM_SIZE, HackMachine
+from Listing import Listing
+
+
+FOLDED_EXTENSION = ".folded"
+# The frame of code that runs outside any function, such as the bootstrap.
+ROOT_FRAME = "(bootstrap)"
+
+
+def call_labels(listing: Listing) -> typing.Tuple[typing.Dict[int, str],
+                                                  typing.Set[int]]:
+    """Finds the function entry points and return addresses of a translated
+    program. Functions are the labels named by a "function" VM command
+    comment, or when the program has no comments, the labels that look like
+    VM function names (Class.name). Return addresses are the labels the VM
+    translator's call code creates: returnAddressN, or Function$ret.N as in
+    the book.
+
+    Args:
+        listing (Listing): the listing of the program.
+
+    Returns:
+        typing.Tuple[typing.Dict[int, str], typing.Set[int]]: the name of
+        the function at every entry address, and the return addresses.
+    """
+    declared = {text.split()[1] for text in listing.vm_command_texts
+                if text.startswith("function ") and len(text.split()) > 1}
+    entries = {}
+    returns = set()
+    for address, name in zip(listing.label_addresses, listing.label_names):
+        if name.startswith("returnAddress") or "$ret." in name:
+            returns.add(address)
+        elif name in declared or (not declared and "." in name and
+                                  "$" not in name):
+            entries[address] = name
+    return entries, returns
+
+
+class CallStackMachine(CompiledMachine):
+    """A CompiledMachine that follows the VM call stack of the program it
+    runs, and counts the cycles spent under every chain of calls.
+
+    Execution arriving at a function's entry label, with LCL equal to SP
+    as the VM translator's call code leaves them, pushes a frame, which
+    remembers the return address the call saved at RAM[LCL - 5]. Arriving
+    at that return address pops the frame again. Other jumps to the same
+    labels, like a loop whose label shares the address of a return
+    address, are ignored. Compiled blocks end at these labels, whether
+    they jump or fall through to them, so every call and return happens
+    between two blocks.
+
+    `stacks` maps each call chain, written as the function names from the
+    outermost call joined by ';', to its cycles: the collapsed-stack format
+    that flame graph tools read.
+    """
+
+    def __init__(self) -> None:
+        """Creates a machine with zeroed ROM, RAM and registers."""
+        self.function_entries = {}
+        self.return_addresses = set()
+        self.stacks = {}
+        # (call chain, return address) of every frame.
+        self.stack = [(ROOT_FRAME, None)]
+        super().__init__()
+
+    def _block_table(self) -> typing.List[typing.Any]:
+        # Blocks cut at call labels differ from the shared ones.
+        return [None] * ROM_SIZE
+
+    def load(self, path: str) -> None:
+        """Loads a program, see HackMachine.load(), and finds its call labels
+        in its listing.
+
+        Args:
+            path (str): the program file.
+        """
+        super().load(path)
+        if self.listing is not None:
+            self.function_entries, self.return_addresses = \
+                call_labels(self.listing)
+        self.blocks = self._block_table()
+        self.reset()
+
+    def load_words(self, words: typing.Sequence[int]) -> None:
+        """Replaces the ROM with the given program, which has no call labels
+        until load() finds them, and resets the machine.
+
+        Args:
+            words (typing.Sequence[int]): the program's 16-bit instructions.
+        """
+        self.function_entries = {}
+        self.return_addresses = set()
+        self.stacks = {}
+        super().load_words(words)
+
+    def reset(self) -> None:
+        """Resets the program counter, cycle count and call stack. A program
+        that starts at a function's entry, as ones without bootstrap code
+        do, starts inside that function."""
+        super().reset()
+        self.stack = [(ROOT_FRAME, None)]
+        if self.pc in self.function_entries:
+            self.stack.append((self.function_entries[self.pc], None))
+
+    def run(self, cycles: int) -> None:
+        """Executes instructions, one per clock cycle, adding the cycles to
+        the call chain they ran under.
+
+        Args:
+            cycles (int): the number of cycles to run.
+        """
+        blocks = self.blocks
+        decoded = self.decoded
+        ram = self.ram
+        stacks = self.stacks
+        stops = set(self.function_entries) | self.return_addresses
+        a_register, d_register = self.A, self.D
+        pc = self.pc % ROM_SIZE
+        remaining = cycles
+        while remaining:
+            block = blocks[pc]
+            if block is None:
+                block = blocks[pc] = compile_block(decoded, pc, stops=stops)
+            function, length = block
+            if length > remaining:
+                break
+            a_register, d_register, pc, executed = function(
+                ram, a_register, d_register, remaining)
+            if not executed:
+                break
+            remaining -= executed
+            key = self.stack[-1][0]
+            stacks[key] = stacks.get(key, 0) + executed
+            if pc in stops:
+                self._follow(pc)
+        self.A, self.D, self.pc = a_register, d_register, pc
+        self.cycles += cycles - remaining
+        for _ in range(remaining):
+            key = self.stack[-1][0]
+            stacks[key] = stacks.get(key, 0) + 1
+            HackMachine.run(self, 1)
+            if self.pc in stops:
+                self._follow(self.pc)
+
+    def fork(self) -> "CallStackMachine":
+        """Starts a child run from the current state, see HackMachine.fork().
+        The child continues the call stack and counts its own cycles on top
+        of the ones counted so far.
+
+        Returns:
+            CallStackMachine: the child machine.
+        """
+        child = super().fork()
+        child.stack = list(self.stack)
+        child.stacks = dict(self.stacks)
+        return child
+
+    def _follow(self, address: int) -> None:
+        """Pushes or pops a frame for execution arriving at a call label."""
+        ram = self.ram
+        name = self.function_entries.get(address)
+        if name is not None and ram[1] == ram[0]:
+            return_address = ram[(ram[1] - 5) & 0x7FFF]
+            key = name if len(self.stack) == 1 else \
+                self.stack[-1][0] + ";" + name
+            self.stack.append((key, return_address))
+        elif address == self.stack[-1][1]:
+            self.stack.pop()
+
+    def write_folded(self, output_file: typing.TextIO) -> None:
+        """Writes the cycles of every call chain in the collapsed-stack
+        format, one "chain count" line each.
+
+        Args:
+            output_file (typing.TextIO): the profile file.
+        """
+        output_file.write("".join(
+            [key + " " + str(count) + "\n"
+             for key, count in sorted(self.stacks.items()) if count]))
@@ -0,0 +1,286 @@
+"""This file is part of nand2tetris, as taught in The Hebrew University,
+and was written by Aviv Yaish according to the specifications given in
+https://www.nand2tetris.org (Shimon Schocken and Noam Nisan, 2017)
+and as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported License (https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import array
+import copy
+import hashlib
+import os
+import sys
+import typing
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "assembler"))
+from Listing import LISTING_EXTENSION, Listing  # noqa: E402
+from Main import assemble  # noqa: E402
+from Rom import ROM_EXTENSION, RomFile  # noqa: E402
+
+
+ROM_SIZE = 32768
+RAM_SIZE = 32768
+SCREEN = 16384
+KBD = 24576
+
+# Kinds of decoded instructions.
+A_INSTRUCTION = 0
+C_INSTRUCTION = 1
+SHIFT_INSTRUCTION = 2
+# Sits just past the end of ROM, where the program counter wraps to 0.
+WRAP = 3
+
+
+# Shorter forms of the ALU functions the Hack assembly language names.
+_NAMED_FUNCTIONS = {
+    0b101010: "0", 0b111111: "1", 0b111010: "0xFFFF", 0b001100: "{x}",
+    0b110000: "{y}", 0b001101: "({x} ^ 0xFFFF)", 0b110001: "({y} ^ 0xFFFF)",
+    0b001111: "(-{x} & 0xFFFF)", 0b110011: "(-{y} & 0xFFFF)",
+    0b011111: "(({x} + 1) & 0xFFFF)", 0b110111: "(({y} + 1) & 0xFFFF)",
+    0b001110: "(({x} - 1) & 0xFFFF)", 0b110010: "(({y} - 1) & 0xFFFF)",
+    0b000010: "(({x} + {y}) & 0xFFFF)", 0b010011: "(({x} - {y}) & 0xFFFF)",
+    0b000111: "(({y} - {x}) & 0xFFFF)", 0b000000: "({x} & {y})",
+    0b010101: "({x} | {y})"}
+
+
+def alu_expression(control: int, x: str, y: str) -> str:
+    """
+    Args:
+        control (int): the ALU's six control bits (zx, nx, zy, ny, f, no).
+        x (str): a Python expression for the x input, D.
+        y (str): a Python expression for the y input, A or M. Both inputs
+        appear at most once in the result.
+
+    Returns:
+        str: a Python expression for the ALU output as an unsigned 16-bit
+        value.
+    """
+    if control in _NAMED_FUNCTIONS:
+        return _NAMED_FUNCTIONS[control].format(x=x, y=y)
+    zx, nx, zy, ny, f, no = [(control >> bit) & 1 for bit in range(5, -1, -1)]
+    x = "0" if zx else x
+    if nx:
+        x = "(" + x + " ^ 0xFFFF)"
+    y = "0" if zy else y
+    if ny:
+        y = "(" + y + " ^ 0xFFFF)"
+    out = "((" + x + " + " + y + ") & 0xFFFF)" if f else \
+        "(" + x + " & " + y + ")"
+    if no:
+        out = "(" + out + " ^ 0xFFFF)"
+    return out
+
+
+def _make_alu() -> typing.Tuple[typing.Callable[[int, int], int], ...]:
+    """Builds one function per setting of the ALU's control bits, each
+    computing out from x = D and y = A or M."""
+    return tuple(eval("lambda x, y: " + alu_expression(control, "x", "y"))
+                 for control in range(64))
+
+
+ALU = _make_alu()
+
+
+def decode(word: int) -> typing.Tuple[int, int, int, int, int, int]:
+    """
+    Args:
+        word (int): a 16-bit instruction.
+
+    Returns:
+        typing.Tuple[int, int, int, int, int, int]: the kind of the
+        instruction, its A value (A-instructions only), a-bit, six comp
+        bits, three dest bits and three jump bits.
+    """
+    if not word & 0x8000:
+        return A_INSTRUCTION, word, 0, 0, 0, 0
+    kind = C_INSTRUCTION if word & 0x4000 else SHIFT_INSTRUCTION
+    return kind, 0, (word >> 12) & 1, (word >> 6) & 63, (word >> 3) & 7, \
+        word & 7
+
+
+def is_jump_taken(jump: int, out: int) -> bool:
+    """
+    Args:
+        jump (int): the three jump bits of a C-instruction.
+        out (int): the ALU output, as an unsigned 16-bit value.
+
+    Returns:
+        bool: whether the instruction jumps.
+    """
+    return bool((jump & 4 and out & 0x8000) or (jump & 2 and out == 0) or
+                (jump & 1 and out and not out & 0x8000))
+
+
+class MemoryAccessError(Exception):
+    """A program read or wrote M while A held an address past the end of
+    RAM, which only a computed A can do."""
+
+
+def to_signed(value: int) -> int:
+    """
+    Args:
+        value (int): an unsigned 16-bit value.
+
+    Returns:
+        int: the value as a two's complement 16-bit integer.
+    """
+    return value - 0x10000 if value & 0x8000 else value
+
+
+class HackMachine:
+    """A Hack computer: 32K words of ROM and RAM held in arrays, the A, D
+    and PC registers, and a count of executed cycles. `listing` maps the
+    loaded program back to its source, when one is available.
+
+    ROM words are decoded once, when they are loaded, into tuples that the
+    run() loop dispatches on directly.
+    """
+
+    def __init__(self) -> None:
+        """Creates a machine with zeroed ROM, RAM and registers."""
+        self.rom = array.array("H", bytes(2 * ROM_SIZE))
+        self.ram = array.array("H", bytes(2 * RAM_SIZE))
+        self.decoded = [decode(0)] * ROM_SIZE + [(WRAP, 0, 0, 0, 0, 0)]
+        self.program_size = 0
+        self.listing = None
+        self.A = 0
+        self.D = 0
+        self.pc = 0
+        self.cycles = 0
+
+    def load_words(self, words: typing.Sequence[int]) -> None:
+        """Replaces the ROM with the given program and resets the machine.
+
+        Args:
+            words (typing.Sequence[int]): the program's 16-bit instructions.
+        """
+        if len(words) > ROM_SIZE:
+            raise ValueError("program of " + str(len(words)) +
+                             " words does not fit in ROM")
+        self.rom = array.array("H", bytes(2 * ROM_SIZE))
+        self.rom[:len(words)] = array.array("H", words)
+        self.decoded = [decode(word) for word in self.rom] + \
+            [(WRAP, 0, 0, 0, 0, 0)]
+        self.program_size = len(words)
+        self.listing = None
+        self.reset()
+
+    def load(self, path: str) -> None:
+        """Loads a program from a .asm, .hack or packed ROM file. The
+        listing of an assembly file is built while assembling it, and that
+        of a machine code file is read from the listing file next to it, if
+        the assembler wrote one.
+
+        Args:
+            path (str): the program file.
+        """
+        root, extension = os.path.splitext(path)
+        extension = extension.lower()
+        if extension == ".asm":
+            listing = Listing()
+            listing.source = os.path.basename(path)
+            with open(path) as input_file:
+                self.load_words(assemble(input_file, listing=listing))
+            self.listing = listing
+            return
+        if extension == ROM_EXTENSION:
+            with RomFile(path) as rom_file:
+                self.load_words(rom_file.words)
+        else:
+            with open(path) as input_file:
+                self.load_words([int(line, 2) for line in input_file
+                                 if line.strip()])
+        if os.path.exists(root + LISTING_EXTENSION):
+            with open(root + LISTING_EXTENSION) as listing_file:
+                self.listing = Listing.load(listing_file)
+
+    def rom_hash(self) -> bytes:
+        """
+        Returns:
+            bytes: a digest of the ROM contents.
+        """
+        return hashlib.blake2b(self.rom.tobytes(), digest_size=16).digest()
+
+    def fork(self) -> "HackMachine":
+        """Starts a child run from the current state, without repeating the
+        run that led to it. The child shares the ROM, its decoded form and
+        the listing, which no run modifies, and gets its own copy of the
+        RAM and registers.
+
+        Returns:
+            HackMachine: the child machine.
+        """
+        child = copy.copy(self)
+        child.ram = array.array("H", self.ram)
+        return child
+
+    def reset(self) -> None:
+        """Resets the program counter and cycle count, like the CPU's reset
+        input. RAM and the A and D registers are kept."""
+        self.pc = 0
+        self.cycles = 0
+
+    def run(self, cycles: int) -> None:
+        """Executes instructions, one per clock cycle.
+
+        Args:
+            cycles (int): the number of cycles to run.
+
+        Raises:
+            MemoryAccessError: when an instruction accesses M past the end
+            of RAM. The machine is left at that instruction, which did not
+            run.
+        """
+        decoded = self.decoded
+        ram = self.ram
+        alu = ALU
+        a_register, d_register, pc = self.A, self.D, self.pc
+        remaining = cycles
+        try:
+            while remaining:
+                kind, value, a_bit, comp, dest, jump = decoded[pc]
+                if kind == A_INSTRUCTION:
+                    a_register = value
+                    pc += 1
+                    remaining -= 1
+                    continue
+                if kind == C_INSTRUCTION:
+                    out = alu[comp](d_register,
+                                    ram[a_register] if a_bit else a_register)
+                elif kind == SHIFT_INSTRUCTION:
+                    operand = d_register if comp & 16 else \
+                        ram[a_register] if a_bit else a_register
+                    out = (operand << 1) & 0xFFFF if comp & 32 else \
+                        (operand >> 1) | (operand & 0x8000)
+                else:
+                    pc = 0
+                    continue
+                target = a_register
+                if dest:
+                    if dest & 1:
+                        ram[a_register] = out
+                    if dest & 2:
+                        d_register = out
+                    if dest & 4:
+                        a_register = out
+                remaining -= 1
+                if jump and (jump == 7 or (jump & 4 and out & 0x8000) or
+                             (jump & 2 and out == 0) or
+                             (jump & 1 and out and not out & 0x8000)):
+                    pc = target & 0x7FFF
+                else:
+                    pc += 1
+        except IndexError:
+            # Raised before the instruction changed anything, so the
+            # machine stops right at it.
+            self.A, self.D, self.pc = a_register, d_register, pc
+            self.cycles += cycles - remaining
+            raise MemoryAccessError(
+                "pc " + str(pc) + ": M accessed with A = " +
+                str(a_register) + ", past the end of RAM") from None
+        self.A, self.D, self.pc = a_register, d_register, pc
+        self.cycles += cycles
+
+    def step(self) -> None:
+        """Executes a single instruction."""
+        self.run(1)
@@ -0,0 +1,253 @@
+"""This file is part of nand2tetris, as taught in The Hebrew University,
+and was written by Aviv Yaish according to the specifications given in
+https://www.nand2tetris.org (Shimon Schocken and Noam Nisan, 2017)
+and as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported License (https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import argparse
+import hashlib
+import os
+import select
+import sys
+import time
+import typing
+from FastForward import FastForwardMachine
+from HackMachine import KBD, HackMachine
+
+
+# A key event file holds one "cycle keycode" event per line: from that
+# cycle on, RAM[KBD] holds the keycode, 0 when no key is pressed. Empty
+# lines and // comments are ignored.
+KEYS_EXTENSION = ".keys"
+KeyEvent = typing.Tuple[int, int]
+
+DEFAULT_SPEED = 1000000
+DEFAULT_HOLD = 0.1
+# How often the terminal recorder reads the keyboard, per second.
+POLLS_PER_SECOND = 60
+
+# The Hack keycodes of the terminal escape sequences for special keys.
+_ESCAPE_SEQUENCES = {"[A": 131, "[B": 133, "[C": 132, "[D": 130, "[H": 134,
+                     "[F": 135, "[5~": 136, "[6~": 137, "[2~": 138,
+                     "[3~": 139, "OP": 141, "OQ": 142, "OR": 143, "OS": 144}
+NEWLINE_KEY = 128
+BACKSPACE_KEY = 129
+ESCAPE_KEY = 140
+
+
+def read_events(input_file: typing.TextIO) -> typing.List[KeyEvent]:
+    """Reads a key event file.
+
+    Args:
+        input_file (typing.TextIO): the key event file.
+
+    Returns:
+        typing.List[KeyEvent]: the events, in the order of their cycles.
+    """
+    events = []
+    for line_number, line in enumerate(input_file, 1):
+        words = line.split("//")[0].split()
+        if not words:
+            continue
+        if len(words) != 2 or not all(word.isdigit() for word in words):
+            raise ValueError("line " + str(line_number) +
+                             ": expected a cycle and a keycode")
+        cycle, keycode = int(words[0]), int(words[1])
+        if keycode > 0xFFFF:
+            raise ValueError("line " + str(line_number) + ": keycode " +
+                             str(keycode) + " does not fit in a word")
+        if events and cycle < events[-1][0]:
+            raise ValueError("line " + str(line_number) +
+                             ": events must be in the order of their cycles")
+        events.append((cycle, keycode))
+    return events
+
+
+def write_events(events: typing.Sequence[KeyEvent],
+                 output_file: typing.TextIO) -> None:
+    """Writes a key event file.
+
+    Args:
+        events (typing.Sequence[KeyEvent]): the events.
+        output_file (typing.TextIO): the key event file.
+    """
+    output_file.write("// cycle keycode\n" + "".join(
+        [str(cycle) + " " + str(keycode) + "\n"
+         for cycle, keycode in events]))
+
+
+class KeyboardReplay:
+    """Feeds recorded key events to a machine. Every event is written to
+    RAM[KBD] exactly when the machine reaches its cycle, so a replayed run
+    is the same every time.
+    """
+
+    def __init__(self, events: typing.Sequence[KeyEvent]) -> None:
+        """Creates a replay from the start of the events.
+
+        Args:
+            events (typing.Sequence[KeyEvent]): the events, in the order of
+            their cycles.
+        """
+        self.events = list(events)
+        self.next_event = 0
+
+    def rewind(self) -> None:
+        """Starts the replay over, for a machine that was reset."""
+        self.next_event = 0
+
+    def run(self, machine: HackMachine, cycles: int) -> None:
+        """Runs a machine, stopping at every event to feed it.
+
+        Args:
+            machine (HackMachine): the machine.
+            cycles (int): the number of cycles to run.
+        """
+        events = self.events
+        end = machine.cycles + cycles
+        while True:
+            while self.next_event < len(events) and \
+                    events[self.next_event][0] <= machine.cycles:
+                machine.ram[KBD] = events[self.next_event][1]
+                self.next_event += 1
+            if machine.cycles >= end:
+                return
+            until = end
+            if self.next_event < len(events):
+                until = min(until, events[self.next_event][0])
+            machine.run(until - machine.cycles)
+
+
+class KeyboardRecorder:
+    """Records the keys fed to a machine as key events."""
+
+    def __init__(self) -> None:
+        """Creates a recorder with no events."""
+        self.events = []
+
+    def set_key(self, machine: HackMachine, keycode: int) -> None:
+        """Presses a key, or releases the key pressed with keycode 0, at the
+        machine's current cycle.
+
+        Args:
+            machine (HackMachine): the machine.
+            keycode (int): the Hack keycode.
+        """
+        if machine.ram[KBD] != keycode:
+            self.events.append((machine.cycles, keycode))
+        machine.ram[KBD] = keycode
+
+
+def terminal_keycodes(text: str) -> typing.List[int]:
+    """Translates what a terminal sent for the keys typed into Hack
+    keycodes.
+
+    Args:
+        text (str): the characters read from the terminal.
+
+    Returns:
+        typing.List[int]: the keycodes, in the order the keys were typed.
+    """
+    keycodes = []
+    index = 0
+    while index < len(text):
+        character = text[index]
+        index += 1
+        if character == "\x1b":
+            for sequence, keycode in _ESCAPE_SEQUENCES.items():
+                if text.startswith(sequence, index):
+                    keycodes.append(keycode)
+                    index += len(sequence)
+                    break
+            else:
+                keycodes.append(ESCAPE_KEY)
+        elif character in "\r\n":
+            keycodes.append(NEWLINE_KEY)
+        elif character in "\x7f\b":
+            keycodes.append(BACKSPACE_KEY)
+        elif " " <= character <= "~":
+            keycodes.append(ord(character))
+    return keycodes
+
+
+def record_terminal(machine: HackMachine, recorder: KeyboardRecorder,
+                    cycles: int, speed: int, hold: float) -> None:
+    """Runs a machine in real time, feeding it the keys typed in the
+    terminal, until the cycles have run or Ctrl-D is typed. A terminal
+    reports key presses but not releases, so every key is released after
+    it was held for a while, or when the next key is typed.
+
+    Args:
+        machine (HackMachine): the machine.
+        recorder (KeyboardRecorder): records the keys.
+        cycles (int): the most cycles to run.
+        speed (int): the cycles to run per second.
+        hold (float): the seconds a key is held down.
+    """
+    import termios
+    import tty
+    terminal = sys.stdin.fileno()
+    settings = termios.tcgetattr(terminal)
+    tty.setcbreak(terminal)
+    slice_cycles = max(1, speed // POLLS_PER_SECOND)
+    hold_cycles = int(hold * speed)
+    end = machine.cycles + cycles
+    release = None
+    try:
+        while machine.cycles < end:
+            started = time.perf_counter()
+            if select.select([terminal], [], [], 0)[0]:
+                text = os.read(terminal, 64).decode(errors="ignore")
+                if "\x04" in text:
+                    break
+                for keycode in terminal_keycodes(text):
+                    recorder.set_key(machine, keycode)
+                    release = machine.cycles + hold_cycles
+            if release is not None and machine.cycles >= release:
+                recorder.set_key(machine, 0)
+                release = None
+            machine.run(min(slice_cycles, end - machine.cycles))
+            time.sleep(max(0.0, 1 / POLLS_PER_SECOND -
+                           (time.perf_counter() - started)))
+    finally:
+        termios.tcsetattr(terminal, termios.TCSADRAIN, settings)
+
+
+if "__main__" == __name__:
+    # Records the keys typed while a program runs, or replays them
+    argument_parser = argparse.ArgumentParser(prog="Keyboard")
+    argument_parser.add_argument("command", choices=["record", "replay"])
+    argument_parser.add_argument(
+        "program", help="the program to run: .asm, .hack or .rom")
+    argument_parser.add_argument(
+        "keys", help="the " + KEYS_EXTENSION + " file to write or read")
+    argument_parser.add_argument(
+        "--cycles", type=int, required=True, help="the cycles to run")
+    argument_parser.add_argument(
+        "--speed", type=int, default=DEFAULT_SPEED,
+        help="record: the cycles to run per second")
+    argument_parser.add_argument(
+        "--hold", type=float, default=DEFAULT_HOLD,
+        help="record: the seconds every key is held down")
+    arguments = argument_parser.parse_args()
+
+    program_machine = FastForwardMachine()
+    program_machine.load(arguments.program)
+    start = time.perf_counter()
+    if arguments.command == "record":
+        key_recorder = KeyboardRecorder()
+        record_terminal(program_machine, key_recorder, arguments.cycles,
+                        arguments.speed, arguments.hold)
+        with open(arguments.keys, "w") as keys_file:
+            write_events(key_recorder.events, keys_file)
+        print(str(len(key_recorder.events)) + " events in " +
+              str(program_machine.cycles) + " cycles")
+    else:
+        with open(arguments.keys) as keys_file:
+            replay = KeyboardReplay(read_events(keys_file))
+        replay.run(program_machine, arguments.cycles)
+        # The digest of the final RAM tells whether two replays matched.
+        print(str(program_machine.cycles) + " cycles in " +
+              format(time.perf_counter() - start, ".2f") + "s, RAM " +
+              hashlib.blake2b(program_machine.ram.tobytes(),
+                              digest_size=8).hexdigest())
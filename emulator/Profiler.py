@@ -0,0 +1,127 @@
+"""This file is part of nand2tetris, as taught in The Hebrew University,
+and was written by Aviv Yaish according to the specifications given in
+https://www.nand2tetris.org (Shimon Schocken and Noam Nisan, 2017)
+and as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported License (https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import array
+import typing
+from HackMachine import ROM_SIZE
+from Listing import Listing
+
+
+# Stands for instructions with no label or VM command comment before them,
+# such as the bootstrap code.
+UNKNOWN = "(none)"
+
+
+class Profile:
+    """Execution counts of every ROM address.
+
+    Compiled blocks do not count instructions one by one. Every way out of
+    a block, including each pass around a loop inside it, is a site that
+    knows the addresses it executed, and the generated code increments one
+    counter per site. hits() expands the site counters into per-address
+    counts. Instructions that are interpreted rather than compiled are
+    counted directly in `interpreted`.
+    """
+
+    def __init__(self) -> None:
+        """Creates a profile with no counts."""
+        self.site_paths = []
+        self.site_counts = []
+        self.interpreted = array.array("Q", bytes(8 * ROM_SIZE))
+
+    def add_site(self, path: typing.Sequence[int]) -> int:
+        """Registers a way out of a compiled block.
+
+        Args:
+            path (typing.Sequence[int]): the addresses executed in the block
+            before leaving it this way.
+
+        Returns:
+            int: the index of the site's counter in `site_counts`.
+        """
+        self.site_paths.append(tuple(path))
+        self.site_counts.append(0)
+        return len(self.site_counts) - 1
+
+    def hits(self) -> array.array:
+        """
+        Returns:
+            array.array: the number of times each ROM address was executed.
+        """
+        hits = array.array("Q", self.interpreted)
+        for path, count in zip(self.site_paths, self.site_counts):
+            if count:
+                for address in path:
+                    hits[address] += count
+        return hits
+
+    def report(self, listing: typing.Optional[Listing] = None,
+               top: int = 15) -> str:
+        """Summarizes where the cycles went: by label and by VM command,
+        using the program's listing, and by address.
+
+        Args:
+            listing (typing.Optional[Listing]): the listing of the program.
+            top (int): the number of rows in each table.
+
+        Returns:
+            str: the report.
+        """
+        hits = self.hits()
+        total = sum(hits)
+        by_address = sorted(
+            [(count, address) for address, count in enumerate(hits) if count],
+            key=lambda item: (-item[0], item[1]))
+        sections = []
+        if listing is not None:
+            by_label = {}
+            by_command = {}
+            for count, address in by_address:
+                label = listing.label_at(address) or UNKNOWN
+                by_label[label] = by_label.get(label, 0) + count
+                command = _command_group(listing.vm_command_at(address))
+                by_command[command] = by_command.get(command, 0) + count
+            sections.append(("label", by_label))
+            sections.append(("VM command", by_command))
+        lines = [str(total) + " instructions executed"]
+        for title, groups in sections:
+            lines.append("")
+            lines.append(_table_header(title))
+            for name, count in sorted(groups.items(),
+                                      key=lambda item: -item[1])[:top]:
+                lines.append(_table_row(count, total, name))
+        lines.append("")
+        lines.append(_table_header("address"))
+        for count, address in by_address[:top]:
+            name = str(address)
+            if listing is not None and address < len(listing.lines):
+                line, label, command = listing.lookup(address)
+                name += " (line " + str(line) + ", " + \
+                    (label or UNKNOWN) + ", " + (command or UNKNOWN) + ")"
+            lines.append(_table_row(count, total, name))
+        return "\n".join(lines)
+
+
+def _command_group(command: typing.Optional[str]) -> str:
+    """Groups a VM command comment by what the translator emits for it: the
+    operation, plus the segment for push and pop."""
+    if command is None:
+        return UNKNOWN
+    words = command.split()
+    if not words:
+        return UNKNOWN
+    if words[0] in ("push", "pop") and len(words) > 1:
+        return words[0] + " " + words[1]
+    return words[0]
+
+
+def _table_header(title: str) -> str:
+    return "cycles".rjust(12) + "   share  by " + title
+
+
+def _table_row(count: int, total: int, name: str) -> str:
+    return str(count).rjust(12) + format(100 * count / total, "7.1f") + \
+        "%  " + name
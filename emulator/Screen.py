@@ -0,0 +1,207 @@
+"""This file is part of nand2tetris, as taught in The Hebrew University,
+and was written by Aviv Yaish according to the specifications given in
+https://www.nand2tetris.org (Shimon Schocken and Noam Nisan, 2017)
+and as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported License (https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import argparse
+import os
+import struct
+import sys
+import time
+import typing
+import zlib
+from FastForward import FastForwardMachine
+from HackMachine import SCREEN, HackMachine
+from Keyboard import KEYS_EXTENSION, KeyboardReplay, read_events
+
+
+SCREEN_WIDTH = 512
+SCREEN_HEIGHT = 256
+# Every row of pixels is 32 words, or 64 bytes, of the screen memory map.
+ROW_BYTES = SCREEN_WIDTH // 8
+SCREEN_WORDS = SCREEN_HEIGHT * ROW_BYTES // 2
+
+PNG_EXTENSION = ".png"
+PPM_EXTENSION = ".ppm"
+IMAGE_FORMATS = [PNG_EXTENSION, PPM_EXTENSION]
+DEFAULT_INTERVAL = 100000
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# 1-bit grayscale, with no interlacing.
+PNG_HEADER = struct.Struct(">IIBBBBB")
+PPM_HEADER = b"P6\n" + str(SCREEN_WIDTH).encode() + b" " + \
+    str(SCREEN_HEIGHT).encode() + b"\n255\n"
+
+# A byte of the screen holds 8 pixels, the leftmost in its lowest bit, and
+# a set bit is black. A PNG row holds them from the highest bit, with 0 for
+# black, so every byte is reversed and inverted.
+_PNG_BYTES = bytes((~int(format(value, "08b")[::-1], 2)) & 0xFF
+                   for value in range(256))
+# The 8 RGB pixels of every byte.
+_PPM_PIXELS = [b"".join(b"\x00\x00\x00" if value >> bit & 1 else
+                        b"\xff\xff\xff" for bit in range(8))
+               for value in range(256)]
+
+
+def screen_bytes(machine: HackMachine) -> bytes:
+    """
+    Args:
+        machine (HackMachine): the machine.
+
+    Returns:
+        bytes: the screen memory map of the machine, as little-endian words.
+    """
+    screen = machine.ram[SCREEN:SCREEN + SCREEN_WORDS]
+    if sys.byteorder != "little":
+        screen.byteswap()
+    return screen.tobytes()
+
+
+def _png_chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + kind + data + \
+        struct.pack(">I", zlib.crc32(kind + data))
+
+
+class ScreenCapture:
+    """Renders the screen of a machine to image files, headless.
+
+    The capture keeps the screen as of the last frame, and the rows of
+    that frame already encoded for the image format. A new frame compares
+    the screen row by row with the last one, and only the rows that
+    changed, the dirty rows, are encoded again. A frame in which nothing
+    changed costs a single comparison.
+    """
+
+    def __init__(self, image_format: str = PNG_EXTENSION) -> None:
+        """Creates a capture of a blank screen.
+
+        Args:
+            image_format (str): PNG_EXTENSION or PPM_EXTENSION.
+        """
+        if image_format not in IMAGE_FORMATS:
+            raise ValueError("unsupported image format " + image_format)
+        self.image_format = image_format
+        self.screen = bytes(2 * SCREEN_WORDS)
+        blank_row = self._encode_row(self.screen[:ROW_BYTES])
+        self.rows = [blank_row] * SCREEN_HEIGHT
+        self.dirty_row_count = 0
+
+    def update(self, machine: HackMachine) -> typing.List[int]:
+        """Takes the machine's screen as the new frame.
+
+        Args:
+            machine (HackMachine): the machine.
+
+        Returns:
+            typing.List[int]: the rows that changed since the last frame.
+        """
+        screen = screen_bytes(machine)
+        previous = self.screen
+        if screen == previous:
+            return []
+        dirty = [row for row in range(SCREEN_HEIGHT)
+                 if screen[row * ROW_BYTES:(row + 1) * ROW_BYTES] !=
+                 previous[row * ROW_BYTES:(row + 1) * ROW_BYTES]]
+        for row in dirty:
+            self.rows[row] = self._encode_row(
+                screen[row * ROW_BYTES:(row + 1) * ROW_BYTES])
+        self.screen = screen
+        self.dirty_row_count += len(dirty)
+        return dirty
+
+    def _encode_row(self, row: bytes) -> bytes:
+        if self.image_format == PNG_EXTENSION:
+            # Every PNG row starts with its filter type, none.
+            return b"\x00" + row.translate(_PNG_BYTES)
+        return b"".join([_PPM_PIXELS[value] for value in row])
+
+    def image(self) -> bytes:
+        """
+        Returns:
+            bytes: the current frame as an image file.
+        """
+        if self.image_format == PPM_EXTENSION:
+            return PPM_HEADER + b"".join(self.rows)
+        return PNG_SIGNATURE + \
+            _png_chunk(b"IHDR", PNG_HEADER.pack(
+                SCREEN_WIDTH, SCREEN_HEIGHT, 1, 0, 0, 0, 0)) + \
+            _png_chunk(b"IDAT", zlib.compress(b"".join(self.rows))) + \
+            _png_chunk(b"IEND", b"")
+
+    def record(self, machine: HackMachine, cycles: int, interval: int,
+               directory: str,
+               keys: typing.Optional[KeyboardReplay] = None) \
+            -> typing.List[str]:
+        """Runs a machine, capturing its screen every interval cycles. A
+        frame is written only when the screen changed, to a file named after
+        the cycle it was captured at.
+
+        Args:
+            machine (HackMachine): the machine, with its program loaded.
+            cycles (int): the number of cycles to run.
+            interval (int): the cycles between two frames.
+            directory (str): the directory to write the frames to.
+            keys (typing.Optional[KeyboardReplay]): the key events to feed
+            the machine while it runs.
+
+        Returns:
+            typing.List[str]: the paths of the frames written.
+        """
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+        end = machine.cycles + cycles
+        while True:
+            if self.update(machine) or not paths:
+                path = os.path.join(directory, "frame" + str(
+                    machine.cycles).zfill(10) + self.image_format)
+                with open(path, "wb") as image_file:
+                    image_file.write(self.image())
+                paths.append(path)
+            if machine.cycles >= end:
+                return paths
+            if keys is None:
+                machine.run(min(interval, end - machine.cycles))
+            else:
+                keys.run(machine, min(interval, end - machine.cycles))
+
+
+if "__main__" == __name__:
+    # Runs a program headless and writes its screen to image files
+    argument_parser = argparse.ArgumentParser(prog="Screen")
+    argument_parser.add_argument(
+        "program", help="the program to run: .asm, .hack or .rom")
+    argument_parser.add_argument(
+        "--cycles", type=int, required=True, help="the cycles to run")
+    argument_parser.add_argument(
+        "--interval", type=int, default=DEFAULT_INTERVAL,
+        help="the cycles between two frames")
+    argument_parser.add_argument(
+        "--format", choices=IMAGE_FORMATS, default=PNG_EXTENSION,
+        help="the image format of the frames")
+    argument_parser.add_argument(
+        "--keys", help="a " + KEYS_EXTENSION + " file of key events to "
+                       "replay while the program runs")
+    argument_parser.add_argument(
+        "--output", help="the directory to write the frames to, a "
+                         "directory named after the program by default")
+    arguments = argument_parser.parse_args()
+    if arguments.interval <= 0:
+        argument_parser.error("--interval must be positive")
+
+    program_machine = FastForwardMachine()
+    program_machine.load(arguments.program)
+    capture = ScreenCapture(arguments.format)
+    replay = None
+    if arguments.keys:
+        with open(arguments.keys) as keys_file:
+            replay = KeyboardReplay(read_events(keys_file))
+    start = time.perf_counter()
+    frame_paths = capture.record(
+        program_machine, arguments.cycles, arguments.interval,
+        arguments.output or os.path.splitext(arguments.program)[0] +
+        "_frames", replay)
+    print(str(len(frame_paths)) + " frames, " +
+          str(capture.dirty_row_count) + " dirty rows, " +
+          str(program_machine.cycles) + " cycles in " +
+          format(time.perf_counter() - start, ".2f") + "s")
@@ -0,0 +1,130 @@
+"""This file is part of nand2tetris, as taught in The Hebrew University,
+and was written by Aviv Yaish according to the specifications given in
+https://www.nand2tetris.org (Shimon Schocken and Noam Nisan, 2017)
+and as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported License (https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import array
+import mmap
+import os
+import struct
+import sys
+import typing
+from HackMachine import RAM_SIZE, HackMachine
+
+
+# A snapshot file is a fixed 48 byte header followed by the RAM as
+# little-endian uint16 words, up to the last word that is not zero:
+#   magic (4s) | version (H) | reserved (H) | RAM word count (I) |
+#   ROM hash (16s) | A (H) | D (H) | PC (H) | padding (2x) | cycles (Q) |
+#   padding (4x)
+SNAPSHOT_MAGIC = b"HSNP"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_HEADER = struct.Struct("<4sHHI16sHHH2xQ4x")
+SNAPSHOT_EXTENSION = ".snap"
+
+
+def write_snapshot(machine: HackMachine,
+                   output_file: typing.BinaryIO) -> None:
+    """Writes the state of a machine as a snapshot file. The ROM itself is
+    not stored, only its hash, so the snapshot can be restored into any
+    machine that has loaded the same program.
+
+    Args:
+        machine (HackMachine): the machine.
+        output_file (typing.BinaryIO): writes the snapshot to this binary
+        file.
+    """
+    ram = machine.ram
+    count = len(ram)
+    while count and not ram[count - 1]:
+        count -= 1
+    packed = array.array("H", ram[:count])
+    if sys.byteorder != "little":
+        packed.byteswap()
+    output_file.write(SNAPSHOT_HEADER.pack(
+        SNAPSHOT_MAGIC, SNAPSHOT_VERSION, 0, count, machine.rom_hash(),
+        machine.A, machine.D, machine.pc % 0x8000, machine.cycles))
+    output_file.write(packed.tobytes())
+
+
+def save_snapshot(machine: HackMachine, path: str) -> None:
+    """Writes a snapshot file through a temporary file, so a reader never
+    sees a partial snapshot.
+
+    Args:
+        machine (HackMachine): the machine.
+        path (str): the snapshot file.
+    """
+    temporary_path = path + "." + str(os.getpid()) + ".tmp"
+    try:
+        with open(temporary_path, "wb") as output_file:
+            write_snapshot(machine, output_file)
+        os.replace(temporary_path, path)
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+
+
+class SnapshotFile:
+    """A snapshot file, memory-mapped read-only. `ram` is a view of the
+    stored RAM words over the mapping, so opening a snapshot reads nothing
+    but its header, and restoring it is a single copy into the machine.
+    """
+
+    def __init__(self, path: str) -> None:
+        """Maps the snapshot file and validates its header.
+
+        Args:
+            path (str): path of the snapshot file.
+        """
+        with open(path, "rb") as snapshot_file:
+            self.map = mmap.mmap(snapshot_file.fileno(), 0,
+                                 access=mmap.ACCESS_READ)
+        if len(self.map) < SNAPSHOT_HEADER.size:
+            self.map.close()
+            raise ValueError(path + " is too short to be a snapshot file")
+        magic, version, _, self.count, self.rom_hash, self.A, self.D, \
+            self.pc, self.cycles = SNAPSHOT_HEADER.unpack_from(self.map)
+        end = SNAPSHOT_HEADER.size + 2 * self.count
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION or \
+                self.count > RAM_SIZE or len(self.map) < end:
+            self.map.close()
+            raise ValueError(path + " is not a valid snapshot file")
+        if sys.byteorder == "little":
+            self.ram = memoryview(self.map)[SNAPSHOT_HEADER.size:end] \
+                .cast("H")
+        else:
+            self.ram = array.array("H", self.map[SNAPSHOT_HEADER.size:end])
+            self.ram.byteswap()
+
+    def restore(self, machine: HackMachine) -> None:
+        """Puts a machine back in the snapshot's state. Only the machine
+        state is restored: a profile or a call stack being tracked carries
+        on from where it was.
+
+        Args:
+            machine (HackMachine): a machine that has loaded the program
+            the snapshot was taken with.
+        """
+        if machine.rom_hash() != self.rom_hash:
+            raise ValueError("the snapshot was taken with a different ROM")
+        ram = memoryview(machine.ram)
+        ram[:self.count] = self.ram
+        ram[self.count:] = array.array("H", bytes(2 * (RAM_SIZE - self.count)))
+        ram.release()
+        machine.A, machine.D, machine.pc = self.A, self.D, self.pc
+        machine.cycles = self.cycles
+
+    def close(self) -> None:
+        """Releases the mapping."""
+        if isinstance(self.ram, memoryview):
+            self.ram.release()
+        self.map.close()
+
+    def __enter__(self) -> "SnapshotFile":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -0,0 +1,213 @@
+"""This file is part of nand2tetris, as taught in The Hebrew University,
+and was written by Aviv Yaish according to the specifications given in
+https://www.nand2tetris.org (Shimon Schocken and Noam Nisan, 2017)
+and as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported License (https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import argparse
+import concurrent.futures
+import datetime
+import json
+import os
+import signal
+import sys
+import time
+import typing
+from BlockCompiler import CompiledMachine
+from FastForward import FastForwardMachine
+from TestScript import CycleLimitError, TestScript, command_names
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_TIMEOUT = 60.0
+DEFAULT_MAX_CYCLES = 100000000
+
+PASSED = "passed"
+FAILED = "failed"
+ERROR = "error"
+TIMEOUT = "timeout"
+SKIPPED = "skipped"
+STATUSES = [PASSED, FAILED, ERROR, TIMEOUT, SKIPPED]
+
+# Commands that only the VM emulator runs.
+VM_EMULATOR_COMMANDS = {"vmstep"}
+
+
+class _Timeout(Exception):
+    """Raised in a test by the alarm signal."""
+
+
+def find_scripts(paths: typing.List[str]) -> typing.List[str]:
+    """
+    Args:
+        paths (typing.List[str]): .tst files and directories to search.
+
+    Returns:
+        typing.List[str]: every .tst file given or under a given directory,
+        sorted.
+    """
+    scripts = set()
+    for path in paths:
+        path = os.path.abspath(path)
+        if not os.path.isdir(path):
+            scripts.add(path)
+            continue
+        for directory, _, filenames in os.walk(path):
+            scripts.update(os.path.join(directory, filename)
+                           for filename in filenames
+                           if filename.endswith(".tst"))
+    return sorted(scripts)
+
+
+def run_test(script_path: str, timeout: typing.Optional[float],
+             max_cycles: typing.Optional[int], fast_forward: bool = False) \
+        -> typing.Dict[str, typing.Any]:
+    """Runs one test script on a compiled machine. Runs inside a worker of
+    run_tests(), and enforces the timeout with an alarm signal where the
+    platform has one.
+
+    Args:
+        script_path (str): the .tst file.
+        timeout (typing.Optional[float]): seconds before the test is
+        stopped, or None.
+        max_cycles (typing.Optional[int]): cycles before the test is
+        stopped, or None.
+        fast_forward (bool): run on a FastForwardMachine.
+
+    Returns:
+        typing.Dict[str, typing.Any]: the script, its status, a message for
+        anything but a pass, the cycles it ran and the seconds it took.
+    """
+    record = {"script": script_path, "status": PASSED, "message": "",
+              "cycles": 0, "seconds": 0.0}
+    start = time.perf_counter()
+    alarm = timeout is not None and hasattr(signal, "setitimer")
+    script = None
+    try:
+        if alarm:
+            signal.signal(signal.SIGALRM, _raise_timeout)
+            signal.setitimer(signal.ITIMER_REAL, timeout)
+        machine = FastForwardMachine() if fast_forward else \
+            CompiledMachine()
+        script = TestScript(script_path, machine, max_cycles)
+        if command_names(script.statements) & VM_EMULATOR_COMMANDS:
+            record["status"] = SKIPPED
+            record["message"] = "VM emulator script"
+        else:
+            failure = script.run()
+            if failure is not None:
+                record["status"] = FAILED
+                record["message"] = failure
+    except _Timeout:
+        record["status"] = TIMEOUT
+        record["message"] = "timed out after " + str(timeout) + "s"
+    except CycleLimitError as error:
+        record["status"] = TIMEOUT
+        record["message"] = str(error)
+    except Exception as error:
+        record["status"] = ERROR
+        record["message"] = type(error).__name__ + ": " + str(error)
+    finally:
+        if alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    if script is not None:
+        record["cycles"] = script.machine.cycles
+    record["seconds"] = time.perf_counter() - start
+    return record
+
+
+def _raise_timeout(signal_number: int, frame: typing.Any) -> None:
+    raise _Timeout()
+
+
+def run_tests(scripts: typing.List[str], jobs: int,
+              timeout: typing.Optional[float],
+              max_cycles: typing.Optional[int], fast_forward: bool = False) \
+        -> typing.List[typing.Dict[str, typing.Any]]:
+    """Runs test scripts across a process pool.
+
+    Args:
+        scripts (typing.List[str]): the .tst files.
+        jobs (int): the number of worker processes.
+        timeout (typing.Optional[float]): see run_test().
+        max_cycles (typing.Optional[int]): see run_test().
+        fast_forward (bool): see run_test().
+
+    Returns:
+        typing.List[typing.Dict[str, typing.Any]]: one record per script,
+        in the order of scripts.
+    """
+    if jobs <= 1 or len(scripts) <= 1:
+        return [run_test(script, timeout, max_cycles, fast_forward)
+                for script in scripts]
+    with concurrent.futures.ProcessPoolExecutor(
+            min(jobs, len(scripts))) as executor:
+        return list(executor.map(run_test, scripts,
+                                 [timeout] * len(scripts),
+                                 [max_cycles] * len(scripts),
+                                 [fast_forward] * len(scripts)))
+
+
+def format_record(record: typing.Dict[str, typing.Any]) -> str:
+    """
+    Returns:
+        str: one human readable line for a record.
+    """
+    line = record["status"].upper().ljust(8) + \
+        format(record["seconds"] * 1000, "8.1f") + "ms " + \
+        str(record["cycles"]).rjust(10) + " cycles  " + \
+        os.path.relpath(record["script"], ROOT)
+    if record["message"]:
+        line += ": " + record["message"]
+    return line
+
+
+def summarize(records: typing.List[typing.Dict[str, typing.Any]],
+              seconds: float) -> str:
+    """
+    Returns:
+        str: the count of every status and the wall time of the run.
+    """
+    counts = [str(sum(1 for record in records if record["status"] == status))
+              + " " + status for status in STATUSES]
+    return ", ".join(counts) + " in " + format(seconds, ".2f") + "s"
+
+
+if "__main__" == __name__:
+    argument_parser = argparse.ArgumentParser(prog="TestRunner")
+    argument_parser.add_argument(
+        "paths", nargs="*", default=[ROOT],
+        help=".tst files or directories to search, the whole tree by "
+             "default")
+    argument_parser.add_argument(
+        "--jobs", type=int, default=os.cpu_count() or 1, metavar="N",
+        help="run the tests in N worker processes")
+    argument_parser.add_argument(
+        "--timeout", type=float, default=DEFAULT_TIMEOUT, metavar="SECONDS",
+        help="stop a test after this long")
+    argument_parser.add_argument(
+        "--max-cycles", type=int, default=DEFAULT_MAX_CYCLES,
+        help="stop a test after this many cycles")
+    argument_parser.add_argument(
+        "--fast-forward", action="store_true",
+        help="skip loops that spin without changing the machine's state")
+    argument_parser.add_argument(
+        "--output", help="also write the results to this JSON file")
+    arguments = argument_parser.parse_args()
+
+    start = time.perf_counter()
+    results = run_tests(find_scripts(arguments.paths), arguments.jobs,
+                        arguments.timeout, arguments.max_cycles,
+                        arguments.fast_forward)
+    wall_time = time.perf_counter() - start
+    for result in results:
+        print(format_record(result))
+    print(summarize(results, wall_time))
+    if arguments.output:
+        with open(arguments.output, "w") as results_file:
+            json.dump({"date": datetime.datetime.now().isoformat(),
+                       "wall": wall_time, "results": results}, results_file,
+                      indent=1)
+    if any(result["status"] in (FAILED, ERROR, TIMEOUT)
+           for result in results):
+        sys.exit(1)
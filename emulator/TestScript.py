@@ -0,0 +1,308 @@
+"""This file is part of nand2tetris, as taught in The Hebrew University,
+and was written by Aviv Yaish according to the specifications given in
+https://www.nand2tetris.org (Shimon Schocken and Noam Nisan, 2017)
+and as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported License (https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import os
+import re
+import typing
+from HackMachine import ROM_SIZE, HackMachine, to_signed
+
+
+# A statement is its words and the line it starts on; a block statement
+# (repeat or while) also has the statements of its body.
+Statement = typing.Tuple[typing.List[str], int,
+                         typing.Optional[typing.List[typing.Any]]]
+
+_TOKEN = re.compile(r"//[^\n]*|/\*.*?\*/|[,;{}]|[^\s,;{}]+|\n", re.DOTALL)
+_OUTPUT_COLUMN = re.compile(r"^(.+)%([DXBS])(\d+)\.(\d+)\.(\d+)$")
+_RAM = re.compile(r"^RAM\[(\d+)\]$")
+_CONDITIONS = {"=": lambda a, b: a == b, "<>": lambda a, b: a != b,
+               "<": lambda a, b: a < b, ">": lambda a, b: a > b,
+               "<=": lambda a, b: a <= b, ">=": lambda a, b: a >= b}
+# Commands that only matter to the GUI.
+_IGNORED = {"echo", "clear-echo", "breakpoint", "clear-breakpoints"}
+
+
+class ScriptError(ValueError):
+    """A malformed test script, or one using a command outside the subset
+    TestScript runs (such as the VM emulator's vmstep)."""
+
+
+class CycleLimitError(Exception):
+    """A test script tried to run the machine past its cycle limit."""
+
+
+def parse_script(text: str) -> typing.List[Statement]:
+    """
+    Args:
+        text (str): the contents of a .tst file.
+
+    Returns:
+        typing.List[Statement]: its top-level statements.
+    """
+    tokens = []
+    line_number = 1
+    for match in _TOKEN.finditer(text):
+        token = match.group()
+        if token == "\n":
+            line_number += 1
+        elif token.startswith("/"):
+            line_number += token.count("\n")
+        else:
+            tokens.append((token, line_number))
+    statements, index = _parse_block(tokens, 0)
+    if index < len(tokens):
+        raise ScriptError("line " + str(tokens[index][1]) +
+                          ": unexpected '" + tokens[index][0] + "'")
+    return statements
+
+
+def command_names(statements: typing.List[Statement]) -> typing.Set[str]:
+    """
+    Args:
+        statements (typing.List[Statement]): parsed statements.
+
+    Returns:
+        typing.Set[str]: the first word of every statement, including
+        those inside blocks.
+    """
+    names = set()
+    for words, _, body in statements:
+        if words:
+            names.add(words[0])
+        if body is not None:
+            names |= command_names(body)
+    return names
+
+
+def _parse_block(tokens: typing.List[typing.Tuple[str, int]], index: int) \
+        -> typing.Tuple[typing.List[Statement], int]:
+    """Parses statements up to a closing brace or the end of the tokens."""
+    statements = []
+    words = []
+    line_number = 0
+    while index < len(tokens):
+        token, token_line = tokens[index]
+        index += 1
+        if token == "}":
+            index -= 1
+            break
+        if not words:
+            line_number = token_line
+        if token in (",", ";"):
+            if words:
+                statements.append((words, line_number, None))
+            words = []
+        elif token == "{":
+            body, index = _parse_block(tokens, index)
+            if index >= len(tokens):
+                raise ScriptError("line " + str(line_number) +
+                                  ": missing '}'")
+            index += 1
+            statements.append((words, line_number, body))
+            words = []
+        else:
+            words.append(token)
+    if words:
+        statements.append((words, line_number, None))
+    return statements, index
+
+
+class TestScript:
+    """Runs a CPU emulator test script: the commands load, output-file,
+    compare-to, output-list, set, output, ticktock and the repeat and while
+    blocks. Output lines are written to the output file and checked against
+    the compare file, both in the Java emulator's table format.
+    """
+
+    def __init__(self, script_path: str,
+                 machine: typing.Optional[HackMachine] = None,
+                 max_cycles: typing.Optional[int] = None) -> None:
+        """
+        Args:
+            script_path (str): the .tst file. Paths inside it are relative
+            to its directory.
+            machine (typing.Optional[HackMachine]): the machine to run on,
+            a new one by default.
+            max_cycles (typing.Optional[int]): the most cycles the script
+            may run, or None for no limit.
+        """
+        self.script_path = script_path
+        self.directory = os.path.dirname(os.path.abspath(script_path))
+        self.machine = machine if machine is not None else HackMachine()
+        self.max_cycles = max_cycles
+        self.output_path = None
+        self.compare_path = None
+        self.columns = []
+        self.output_lines = []
+        with open(script_path) as script_file:
+            self.statements = parse_script(script_file.read())
+
+    def run(self) -> typing.Optional[str]:
+        """Runs the script, then writes the output file.
+
+        Returns:
+            typing.Optional[str]: None when the output matches the compare
+            file (or there is none), else a description of the first
+            mismatch, worded like the Java emulator's.
+        """
+        self._run_block(self.statements)
+        if self.output_path is not None:
+            with open(self.output_path, "w") as output_file:
+                output_file.write("".join([line + "\n"
+                                           for line in self.output_lines]))
+        if self.compare_path is None:
+            return None
+        with open(self.compare_path) as compare_file:
+            expected = [line.rstrip("\r\n") for line in compare_file]
+        for index, line in enumerate(self.output_lines):
+            if index >= len(expected) or line != expected[index]:
+                return "Comparison failure at line " + str(index + 1)
+        if len(expected) > len(self.output_lines):
+            return "Comparison failure at line " + \
+                str(len(self.output_lines) + 1) + ": output ended early"
+        return None
+
+    def _run_block(self, statements: typing.List[Statement]) -> None:
+        for words, line_number, body in statements:
+            try:
+                if body is None:
+                    self._run_command(words)
+                else:
+                    self._run_loop(words, body)
+            except (ScriptError, IndexError, ValueError) as error:
+                message = str(error)
+                if not message.startswith("line "):
+                    message = "line " + str(line_number) + ": " + message
+                raise ScriptError(message) from error
+
+    def _run_loop(self, words: typing.List[str],
+                  body: typing.List[Statement]) -> None:
+        only_ticks = all(statement == (["ticktock"], statement[1], None)
+                         for statement in body)
+        if words[0] == "repeat" and len(words) == 2:
+            count = int(words[1])
+            if only_ticks:
+                # The common case, repeat N { ticktock; }, is one call.
+                self._tick(count * len(body))
+                return
+            for _ in range(count):
+                self._run_block(body)
+        elif words[0] == "while" and len(words) == 4:
+            compare = _CONDITIONS.get(words[2])
+            if compare is None:
+                raise ScriptError("unknown condition '" + words[2] + "'")
+            while compare(self._read(words[1]), self._value(words[3])):
+                if only_ticks:
+                    self._tick(len(body))
+                else:
+                    self._run_block(body)
+        else:
+            raise ScriptError("unsupported block '" + " ".join(words) + "'")
+
+    def _run_command(self, words: typing.List[str]) -> None:
+        command = words[0]
+        if command == "ticktock" and len(words) == 1:
+            self._tick(1)
+        elif command == "set" and len(words) == 3:
+            self._write(words[1], self._value(words[2]))
+        elif command == "output" and len(words) == 1:
+            self.output_lines.append(self._format_row())
+        elif command == "load" and len(words) == 2:
+            self.machine.load(os.path.join(self.directory, words[1]))
+        elif command == "output-file" and len(words) == 2:
+            self.output_path = os.path.join(self.directory, words[1])
+        elif command == "compare-to" and len(words) == 2:
+            self.compare_path = os.path.join(self.directory, words[1])
+        elif command == "output-list":
+            self.columns = [self._parse_column(word) for word in words[1:]]
+            self.output_lines.append(self._format_header())
+        elif command not in _IGNORED:
+            raise ScriptError("unsupported command '" + " ".join(words) +
+                              "'")
+
+    def _tick(self, cycles: int) -> None:
+        """Runs the machine, within the cycle limit."""
+        if self.max_cycles is not None and \
+                self.machine.cycles + cycles > self.max_cycles:
+            raise CycleLimitError("cycle limit of " + str(self.max_cycles) +
+                                  " exceeded")
+        self.machine.run(cycles)
+
+    @staticmethod
+    def _parse_column(word: str) -> typing.Tuple[str, str, int, int, int]:
+        match = _OUTPUT_COLUMN.match(word)
+        if match is None:
+            raise ScriptError("bad output-list entry '" + word + "'")
+        name, kind, left, width, right = match.groups()
+        return name, kind, int(left), int(width), int(right)
+
+    def _format_header(self) -> str:
+        cells = []
+        for name, _, left, width, right in self.columns:
+            size = left + width + right
+            name = name[:size]
+            left_space = (size - len(name)) // 2
+            cells.append(" " * left_space + name +
+                         " " * (size - left_space - len(name)))
+        return "|" + "|".join(cells) + "|"
+
+    def _format_row(self) -> str:
+        cells = []
+        for name, kind, left, width, right in self.columns:
+            value = self._read(name)
+            if kind == "D":
+                text = str(value).rjust(width)
+            elif kind == "X":
+                text = format(value & 0xFFFF, "04X").rjust(width)
+            elif kind == "B":
+                text = format(value & 0xFFFF, "016b").rjust(width)
+            else:
+                text = str(value).ljust(width)
+            cells.append(" " * left + text[-width:] + " " * right)
+        return "|" + "|".join(cells) + "|"
+
+    def _read(self, name: str) -> int:
+        """Returns a register, RAM cell or the cycle count, signed."""
+        machine = self.machine
+        match = _RAM.match(name)
+        if match is not None:
+            return to_signed(machine.ram[int(match.group(1))])
+        if name == "A":
+            return to_signed(machine.A)
+        if name == "D":
+            return to_signed(machine.D)
+        if name == "PC":
+            return machine.pc % ROM_SIZE
+        if name == "time":
+            return machine.cycles
+        raise ScriptError("unknown variable '" + name + "'")
+
+    def _write(self, name: str, value: int) -> None:
+        machine = self.machine
+        match = _RAM.match(name)
+        if match is not None:
+            machine.ram[int(match.group(1))] = value & 0xFFFF
+        elif name == "A":
+            machine.A = value & 0xFFFF
+        elif name == "D":
+            machine.D = value & 0xFFFF
+        elif name == "PC":
+            machine.pc = value & 0x7FFF
+        else:
+            raise ScriptError("cannot set '" + name + "'")
+
+    def _value(self, text: str) -> int:
+        """Parses a literal in the script's %D/%X/%B notation, or reads a
+        variable."""
+        if text.startswith("%X"):
+            return int(text[2:], 16)
+        if text.startswith("%B"):
+            return int(text[2:], 2)
+        if text.startswith("%D"):
+            return int(text[2:])
+        if text.lstrip("-").isdigit():
+            return int(text)
+        return self._read(text)
@@ -4,21 +4,479 @@ https://www.nand2tetris.org (Shimon Schocken and Noam Nisan, 2017)
 and as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
 Unported License (https://creativecommons.org/licenses/by-nc-sa/3.0/).
 """
+import functools
 import typing
+from Parser import ARITHMETIC_COMMANDS, CALL, COMMAND_TYPES, FUNCTION, GOTO, \
+    IF_GOTO, LABEL, POP, PUSH, RETURN, SEGMENTS, Command, command_text
+
+
+# The pieces of assembly the translation of every VM command is made of.
+POP_ASSEMBLY = "@SP\nM = M-1\nA = M\n"
+PUSH_ASSEMBLY = "@SP\nM = M+1\nA = M\n"
+TOP_ASSEMBLY = "@SP\nA = M-1\n"
+# Pushes D.
+PUSH_TEMPLATE = "@SP\nA=M\nM=D\n@SP\nM=M+1\n"
+# Pops into the address held by D.
+POP_TEMPLATE = "@R13\nM=D\n@SP\nAM=M-1\nD=M\n@R13\nA=M\nM=D\n"
+# Pops into D.
+POP_D_TEMPLATE = "@SP\nAM=M-1\nD=M\n"
+
+
+def instruction_count(code: str) -> int:
+    """
+    Args:
+        code (str): assembly code.
+
+    Returns:
+        int: the number of instructions in the code, which is its size in
+        ROM, and for straight-line code also the cycles it takes to run.
+    """
+    return sum(1 for line in code.split("\n")
+               if line and line[0] != "(" and not line.startswith("//"))
+
+
+def cheapest(*candidates: str) -> str:
+    """The instruction selector's cost model: of equivalent sequences of
+    straight-line code, the one with the fewest instructions is both the
+    smallest and the fastest.
+
+    Args:
+        *candidates (str): equivalent sequences, the generic one first,
+        which wins ties.
+
+    Returns:
+        str: the cheapest sequence.
+    """
+    return min(candidates, key=instruction_count)
+
+
+def offset_code(offset: int) -> str:
+    """
+    Args:
+        offset (int): a non-negative number.
+
+    Returns:
+        str: the cheapest code that subtracts the offset from D.
+    """
+    return cheapest("D=D-1\n" * offset, "@" + str(offset) + "\nD=D-A\n")
+
+
+def segment_address(pointer: str, index: int) -> str:
+    """
+    Args:
+        pointer (str): the register holding the base of the segment.
+        index (int): the index in the segment.
+
+    Returns:
+        str: code that loads the address of the entry into A without
+        changing D, which pays off for small indices.
+    """
+    if index == 0:
+        return "@" + pointer + "\nA=M\n"
+    return "@" + pointer + "\nA=M+1\n" + "A=A+1\n" * (index - 1)
+
+
+# Segments held at the address in a pointer, and segments at a fixed base.
+POINTER_SEGMENTS = {"local": "LCL", "argument": "ARG", "this": "THIS",
+                    "that": "THAT"}
+FIXED_SEGMENTS = {"temp": "5", "pointer": "3"}
+
+ARITHMETIC_TEMPLATES = {
+    "add": POP_ASSEMBLY + "D = M\n" + POP_ASSEMBLY + "M = M+D\n" +
+    PUSH_ASSEMBLY,
+    "sub": POP_ASSEMBLY + "D = M\n" + POP_ASSEMBLY + "M = M-D\n" +
+    PUSH_ASSEMBLY,
+    "neg": TOP_ASSEMBLY + "M = -M\n",
+    "not": TOP_ASSEMBLY + "M = !M\n",
+    "and": POP_ASSEMBLY + "D = M\n" + TOP_ASSEMBLY + "M = M&D\n",
+    "or": POP_ASSEMBLY + "D = M\n" + TOP_ASSEMBLY + "M = M|D\n",
+}
+
+
+# The scratch register that holds the return address of a shared routine.
+RETURN_REGISTER = "R15"
+RETURN_FROM_ROUTINE = "@" + RETURN_REGISTER + "\nA=M\n0;JMP\n"
+COMPARISON_JUMPS = {"eq": "JEQ", "gt": "JGT", "lt": "JLT"}
+
+
+def comparison_code(name: str, label: str, false_exit: str,
+                    true_exit: str) -> str:
+    """The code of a comparison of x and y, the two topmost values, which
+    replaces them with true (-1) or false (0). eq compares x - y with 0,
+    which holds even when the subtraction overflows. gt and lt decide
+    operands of different signs by their signs, and subtract the others,
+    which cannot overflow.
+
+    Args:
+        name (str): the comparison, eq, gt or lt.
+        label (str): the prefix of the labels in the code.
+        false_exit (str): the code after false was stored.
+        true_exit (str): the code after true was stored, which ends the
+        comparison.
+
+    Returns:
+        str: the assembly code.
+    """
+    code = "@SP\nAM=M-1\nD=M\n"
+    if name != "eq":
+        # R13 = y. x >= 0 > y means x > y, and x < 0 <= y means x < y.
+        greater = label + ("_true" if name == "gt" else "_false")
+        less = label + ("_true" if name == "lt" else "_false")
+        code += "@R13\nM=D\n@SP\nA=M-1\nD=M\n" + \
+            "@" + label + "_x_negative\nD;JLT\n" + \
+            "@R13\nD=M\n@" + greater + "\nD;JLT\n" + \
+            "@" + label + "_same_sign\n0;JMP\n" + \
+            "(" + label + "_x_negative)\n" + \
+            "@R13\nD=M\n@" + less + "\nD;JGE\n" + \
+            "(" + label + "_same_sign)\n@R13\nD=M\n"
+    return code + "@SP\nA=M-1\nD=M-D\n" + \
+        "@" + label + "_true\nD;" + COMPARISON_JUMPS[name] + "\n" + \
+        "(" + label + "_false)\n@SP\nA=M-1\nM=0\n" + false_exit + \
+        "(" + label + "_true)\n@SP\nA=M-1\nM=-1\n" + true_exit
+
+
+# Joined with a label number, the code of eq, gt and lt.
+COMPARISON_PARTS = {
+    name: comparison_code(name, name + "{}", "@" + name + "{}_end\n0;JMP\n",
+                          "(" + name + "{}_end)\n").split("{}")
+    for name in COMPARISON_JUMPS}
+# With shared comparisons, every comparison calls one routine per operator
+# that returns to the address in RETURN_REGISTER. The call sites, joined
+# with a label number, and the routines.
+COMPARISON_ROUTINE_LABELS = {name: "__compare_" + name
+                             for name in COMPARISON_JUMPS}
+COMPARISON_CALL_PARTS = {
+    name: ["@compareReturn", "\nD=A\n@" + RETURN_REGISTER + "\nM=D\n@" +
+           COMPARISON_ROUTINE_LABELS[name] + "\n0;JMP\n(compareReturn",
+           ")\n"]
+    for name in COMPARISON_JUMPS}
+COMPARISON_ROUTINES = {
+    name: "(" + COMPARISON_ROUTINE_LABELS[name] + ")\n" +
+    comparison_code(name, COMPARISON_ROUTINE_LABELS[name],
+                    RETURN_FROM_ROUTINE, RETURN_FROM_ROUTINE)
+    for name in COMPARISON_JUMPS}
+
+# The generic code of a return.
+RETURN_TEMPLATE = "".join([
+    "@LCL\n", "D=M\n", "@endFrame\n", "M=D\n", "A=D\n", "A=A-1\n" * 5,
+    "D=M\n", "@retAddr\n", "M=D\n",
+    "@ARG\n", "D=M\n", POP_TEMPLATE,
+    "@ARG\n", "D=M+1\n", "@SP\n", "M=D\n",
+    "@endFrame\n", "D=M-1\n", "A=D\n", "D=M\n", "@THAT\n", "M=D\n",
+    "@endFrame\n", "D=M-1\n", "D=D-1\n", "A=D\n", "D=M\n", "@THIS\n", "M=D\n",
+    "@endFrame\n", "D=M-1\n", "D=D-1\n" * 2, "A=D\n", "D=M\n", "@ARG\n",
+    "M=D\n",
+    "@endFrame\n", "D=M-1\n", "D=D-1\n" * 3, "A=D\n", "D=M\n", "@LCL\n",
+    "M=D\n", "@retAddr\n", "A=M\n", "0;JMP\n"])
+
+# The instruction selector's templates: a push that increments SP first,
+# and a return that walks endFrame down the saved frame.
+SELECTED_PUSH_TEMPLATE = cheapest(PUSH_TEMPLATE,
+                                  "@SP\nM=M+1\nA=M-1\nM=D\n")
+SELECTED_RETURN_TEMPLATE = cheapest(RETURN_TEMPLATE, "".join(
+    ["@LCL\nD=M\n@endFrame\nM=D\n",
+     "@5\nA=D-A\nD=M\n@retAddr\nM=D\n",
+     POP_D_TEMPLATE, "@ARG\nA=M\nM=D\n",
+     "@ARG\nD=M+1\n@SP\nM=D\n"] +
+    ["@endFrame\nAM=M-1\nD=M\n@" + pointer + "\nM=D\n"
+     for pointer in ("THAT", "THIS", "ARG", "LCL")] +
+    ["@retAddr\nA=M\n0;JMP\n"]))
+
+
+def frame_template(push: str) -> str:
+    """
+    Args:
+        push (str): the template that pushes D.
+
+    Returns:
+        str: code that pushes the return address in D and the caller's
+        frame.
+    """
+    return push + "".join(["@" + pointer + "\nD=M\n" + push
+                           for pointer in ("LCL", "ARG", "THIS", "THAT")])
+
+
+# Pushes the return address in A and the caller's frame.
+CALL_FRAME_TEMPLATE = "D=A\n" + frame_template(PUSH_TEMPLATE)
+SELECTED_CALL_FRAME_TEMPLATE = "D=A\n" + frame_template(SELECTED_PUSH_TEMPLATE)
+INIT_TEMPLATE = "@256\nD = A\n@SP\nM = D\n"
+
+# With shared calls, a call site loads the called function into R13, the
+# number of arguments into R14 and the return address into D, and jumps
+# to the call routine, which saves the frame. Every return jumps to the
+# return routine.
+CALL_ROUTINE_LABEL = "__call"
+RETURN_ROUTINE_LABEL = "__return"
+CALL_ROUTINE = "(" + CALL_ROUTINE_LABEL + ")\n" + \
+    frame_template(PUSH_TEMPLATE) + \
+    "@R14\nD=M\n@5\nD=D+A\n@SP\nD=M-D\n@ARG\nM=D\n" + \
+    "@SP\nD=M\n@LCL\nM=D\n@R13\nA=M\n0;JMP\n"
+SELECTED_CALL_ROUTINE = cheapest(
+    CALL_ROUTINE, "(" + CALL_ROUTINE_LABEL + ")\n" +
+    frame_template(SELECTED_PUSH_TEMPLATE) +
+    "@SP\nD=M\n@LCL\nM=D\n@R14\nD=D-M\n@5\nD=D-A\n@ARG\nM=D\n" +
+    "@R13\nA=M\n0;JMP\n")
+RETURN_SITE_TEMPLATE = "@" + RETURN_ROUTINE_LABEL + "\n0;JMP\n"
+
+# Every shared routine, in the order they are written, with and without
+# instruction selection, and the label behind them that code falling
+# through to them jumps to.
+SHARED_ROUTINES = {
+    select: {**COMPARISON_ROUTINES,
+             "call": SELECTED_CALL_ROUTINE if select else CALL_ROUTINE,
+             "return": "(" + RETURN_ROUTINE_LABEL + ")\n" +
+             (SELECTED_RETURN_TEMPLATE if select else RETURN_TEMPLATE)}
+    for select in (False, True)}
+ROUTINES_END_LABEL = "__routines_end"
+
+# The buffered output is written once it holds this many pieces.
+FLUSH_THRESHOLD = 8192
+
+
+@functools.lru_cache(maxsize=None)
+def push_pop_code(command: str, segment: str, index: int, filename: str,
+                  select: bool = True) -> str:
+    """The code of a push or pop command. Every command is built once and
+    memoized, as the same segments and indices recur all over a program.
+
+    Args:
+        command (str): "C_PUSH" or "C_POP".
+        segment (str): the memory segment to operate on.
+        index (int): the index in the memory segment.
+        filename (str): the VM file the command is in, which names the
+        static variables.
+        select (bool): whether to select the cheapest code for the segment
+        and index, rather than the generic code.
+
+    Returns:
+        str: the assembly code.
+    """
+    address = "@" + str(index) + "\n"
+    if command == "C_PUSH":
+        push = SELECTED_PUSH_TEMPLATE if select else PUSH_TEMPLATE
+        if segment == "static":
+            return "@" + filename + "." + str(index) + "\n" + "D=M\n" + push
+        if segment in POINTER_SEGMENTS:
+            code = address + "D=A\n" + "@" + POINTER_SEGMENTS[segment] + \
+                "\n" + "A=M+D\n" + "D=M\n" + push
+            if select:
+                code = cheapest(code, segment_address(
+                    POINTER_SEGMENTS[segment], index) + "D=M\n" + push)
+            return code
+        if segment == "constant":
+            code = address + "D=A\n" + push
+            if select and index <= 1:
+                code = cheapest(code, "@SP\nM=M+1\nA=M-1\nM=" +
+                                str(index) + "\n")
+            return code
+        if segment in FIXED_SEGMENTS:
+            code = address + "D=A\n" + "@" + FIXED_SEGMENTS[segment] + \
+                "\n" + "A=A+D\n" + "D=M\n" + push
+            if select:
+                code = cheapest(code, "@" + str(
+                    int(FIXED_SEGMENTS[segment]) + index) + "\nD=M\n" + push)
+            return code
+        return push
+    if command == "C_POP":
+        if segment == "static":
+            return "@SP\n" + "AM=M-1\n" + "D=M\n" + "@" + filename + "." + \
+                str(index) + "\n" + "M=D\n"
+        if segment in POINTER_SEGMENTS:
+            code = address + "D=A\n" + "@" + POINTER_SEGMENTS[segment] + \
+                "\n" + "D=M+D\n" + POP_TEMPLATE
+            if select:
+                code = cheapest(code, POP_D_TEMPLATE + segment_address(
+                    POINTER_SEGMENTS[segment], index) + "M=D\n")
+            return code
+        if segment in FIXED_SEGMENTS:
+            code = address + "D=A\n" + "@" + FIXED_SEGMENTS[segment] + \
+                "\n" + "D=A+D\n" + POP_TEMPLATE
+            if select:
+                code = cheapest(code, POP_D_TEMPLATE + "@" + str(
+                    int(FIXED_SEGMENTS[segment]) + index) + "\nM=D\n")
+            return code
+        return ""
+    raise ValueError("not a push or pop command: " + command)
+
+
+@functools.lru_cache(maxsize=None)
+def call_code(function_name: str, num_args: int,
+              select: bool = True) -> str:
+    """The code of a call, after its return address is loaded into A: it
+    saves the caller's frame, repositions ARG and LCL and jumps.
+
+    Args:
+        function_name (str): the called function.
+        num_args (int): the number of arguments pushed for it.
+        select (bool): whether to select the cheapest code for the frame
+        arithmetic, rather than the generic code.
+
+    Returns:
+        str: the assembly code.
+    """
+    if not select:
+        return CALL_FRAME_TEMPLATE + "@SP\n" + "D=M\n" + "D=D-1\n" * 5 + \
+            "D = D-1\n" * num_args + "@ARG\n" + "M=D\n" + "@SP\n" + \
+            "D=M\n" + "@LCL\n" + "M=D\n" + "@" + function_name + "\n" + \
+            "0;JMP\n"
+    # LCL = SP first, so that D still holds SP for ARG = SP - 5 - nArgs.
+    return SELECTED_CALL_FRAME_TEMPLATE + "@SP\nD=M\n@LCL\nM=D\n" + \
+        offset_code(5 + num_args) + "@ARG\nM=D\n" + \
+        "@" + function_name + "\n0;JMP\n"
+
+
+@functools.lru_cache(maxsize=None)
+def function_code(function_name: str, num_locals: int,
+                  select: bool = True) -> str:
+    """The code of a function declaration, which pushes its zeroed local
+    variables.
+
+    Args:
+        function_name (str): the function.
+        num_locals (int): the number of its local variables.
+        select (bool): whether to select the cheapest code for the locals,
+        rather than a push for every one.
+
+    Returns:
+        str: the assembly code.
+    """
+    code = "(" + function_name + ")\n"
+    if not select:
+        return code + ("D = 0\n" + PUSH_TEMPLATE) * num_locals
+    candidates = [("D = 0\n" + SELECTED_PUSH_TEMPLATE) * num_locals]
+    if num_locals == 1:
+        candidates.append("@SP\nM=M+1\nA=M-1\nM=0\n")
+    elif num_locals > 1:
+        # Zeroes the locals in place, then moves SP past them at once.
+        candidates.append("@SP\nA=M\nM=0\n" + "A=A+1\nM=0\n" *
+                          (num_locals - 1) + "D=A+1\n@SP\nM=D\n")
+    return code + cheapest(*candidates)
+
+
+def shared_call_parts(function_name: str,
+                      num_args: int) -> typing.List[str]:
+    """The code of a call through the call routine, to join with a label
+    number.
+
+    Args:
+        function_name (str): the called function.
+        num_args (int): the number of arguments pushed for it.
+
+    Returns:
+        typing.List[str]: the code before and after the label numbers.
+    """
+    if num_args <= 1:
+        load_args = "@R14\nM=" + str(num_args) + "\n"
+    else:
+        load_args = "@" + str(num_args) + "\nD=A\n@R14\nM=D\n"
+    return ["@" + function_name + "\nD=A\n@R13\nM=D\n" + load_args +
+            "@returnAddress", "\nD=A\n@" + CALL_ROUTINE_LABEL +
+            "\n0;JMP\n(returnAddress", ")\n"]
+
+
+def command_parts(command: Command, filename: str,
+                  shared_comparisons: bool = False,
+                  shared_calls: bool = False,
+                  select: bool = True) -> typing.List[str]:
+    """The code of a parsed VM command, after a comment line holding the
+    command. Commands that create labels, the comparisons, if-goto and
+    call, are split where their label number goes; the others are a single
+    part.
+
+    Args:
+        command (Command): the command, see Parser.iter_commands().
+        filename (str): the VM file the command is in, which names the
+        static variables.
+        shared_comparisons (bool): whether comparisons call the shared
+        routines instead of being inlined.
+        shared_calls (bool): whether calls and returns go through the
+        shared routines instead of being inlined.
+        select (bool): whether to select the cheapest code, rather than
+        the generic code.
+
+    Returns:
+        typing.List[str]: the code before, between and after the label
+        numbers.
+    """
+    opcode, segment, argument, symbol = command
+    if opcode < PUSH:
+        name = ARITHMETIC_COMMANDS[opcode]
+        comparisons = COMPARISON_CALL_PARTS if shared_comparisons else \
+            COMPARISON_PARTS
+        parts = comparisons.get(name) or [ARITHMETIC_TEMPLATES[name]]
+    elif opcode == PUSH or opcode == POP:
+        parts = [push_pop_code(COMMAND_TYPES[opcode], SEGMENTS[segment],
+                               argument,
+                               filename if SEGMENTS[segment] == "static"
+                               else "", select)]
+    elif opcode == LABEL:
+        parts = ["(" + symbol + ")\n"]
+    elif opcode == GOTO:
+        parts = ["@" + symbol + "\n0;JMP\n"]
+    elif opcode == IF_GOTO:
+        parts = [POP_ASSEMBLY + "D = M\n@end", "\nD;JEQ\n@" + symbol +
+                 "\n0;JMP\n(end", ")\n"]
+    elif opcode == CALL and shared_calls:
+        parts = shared_call_parts(symbol, argument)
+    elif opcode == CALL:
+        parts = ["@returnAddress", "\n" + call_code(symbol, argument, select)
+                 + "(returnAddress", ")\n"]
+    elif opcode == FUNCTION:
+        parts = [function_code(symbol, argument, select)]
+    elif shared_calls:
+        parts = [RETURN_SITE_TEMPLATE]
+    else:
+        parts = [SELECTED_RETURN_TEMPLATE if select else RETURN_TEMPLATE]
+    return ["//" + command_text(command) + "\n" + parts[0]] + parts[1:]
 
 
 class CodeWriter:
-    """Translates VM commands into Hack assembly code."""
-
-    def __init__(self, output_stream: typing.TextIO) -> None:
+    """Translates VM commands into Hack assembly code.
+
+    The code of every command comes from templates that are built once,
+    and is appended to a buffer that is written out in large batches.
+    write_command() memoizes the code of every distinct command of a file,
+    so translating a command that was seen before costs a dict lookup and
+    an append. flush() writes what is left, and must be called once the
+    translation is done.
+
+    With shared comparisons, every eq, gt and lt calls a single routine of
+    its operator, and with shared calls, every call and return jumps to a
+    single call or return routine. Both save ROM at the cost of a few
+    cycles per command. write_shared_routines() writes the routines the
+    program used, and must be called after its last command.
+
+    Segment access and frame arithmetic go through an instruction
+    selector, which picks the cheapest of the equivalent sequences for
+    every segment, index and offset, see cheapest().
+    """
+
+    def __init__(self, output_stream: typing.TextIO,
+                 shared_comparisons: bool = False,
+                 shared_calls: bool = False,
+                 select_instructions: bool = True) -> None:
         """Initializes the CodeWriter.
 
         Args:
             output_stream (typing.TextIO): output stream.
+            shared_comparisons (bool): whether comparisons call shared
+            routines instead of being inlined.
+            shared_calls (bool): whether calls and returns go through
+            shared routines instead of being inlined.
+            select_instructions (bool): whether to select the cheapest
+            code, rather than the generic code.
         """
         self.current_label = 0
         self.output_file = output_stream
         self.static_var_filename = ""
+        self.buffer = []
+        self.shared_comparisons = shared_comparisons
+        self.shared_calls = shared_calls
+        self.select_instructions = select_instructions
+        # The shared routines the program used, which are written.
+        self.used_routines = set()
+        # The code of every command of the current file, by command.
+        self.command_cache = {}
 
     def set_file_name(self, filename: str) -> None:
         """Informs the code writer that the translation of a new VM file is
@@ -28,23 +486,53 @@ class CodeWriter:
             filename (str): The name of the VM file.
         """
         self.static_var_filename = filename
+        self.command_cache = {}
+
+    def emit(self, parts: typing.Sequence[str]) -> None:
+        """Appends assembly code to the output.
+
+        Args:
+            parts (typing.Sequence[str]): the code, in parts to join with a
+            new label number, or a single part that needs none.
+        """
+        if len(parts) == 1:
+            self.buffer.append(parts[0])
+        else:
+            self.buffer.append(str(self.current_label).join(parts))
+            self.current_label += 1
+        if len(self.buffer) >= FLUSH_THRESHOLD:
+            self.flush()
 
-    def pop_assembly(self, assembly_command: str):
-        assembly_command += '@SP\n'
-        assembly_command += 'M = M-1\n'
-        assembly_command += 'A = M\n'
-        return assembly_command
+    def flush(self) -> None:
+        """Writes the buffered code to the output stream."""
+        self.output_file.write("".join(self.buffer))
+        self.buffer.clear()
 
-    def push_assembly(self, assembly_command: str):
-        assembly_command += '@SP\n'
-        assembly_command += 'M = M+1\n'
-        assembly_command += 'A = M\n'
-        return assembly_command
+    def write_command(self, command: Command) -> None:
+        """Writes the assembly code that is the translation of a parsed VM
+        command, after a comment line holding the command.
 
-    def top_assembly(self, assembly_command: str):
-        assembly_command += '@SP\n'
-        assembly_command += 'A = M-1\n'
-        return assembly_command
+        Args:
+            command (Command): the command, see Parser.iter_commands().
+        """
+        parts = self.command_cache.get(command)
+        if parts is None:
+            parts = self.command_cache[command] = command_parts(
+                command, self.static_var_filename, self.shared_comparisons,
+                self.shared_calls, self.select_instructions)
+            if self.shared_comparisons and command[0] < PUSH:
+                self.used_routines.add(ARITHMETIC_COMMANDS[command[0]])
+            elif self.shared_calls and command[0] == CALL:
+                self.used_routines.add("call")
+            elif self.shared_calls and command[0] == RETURN:
+                self.used_routines.add("return")
+        if len(parts) > 1:
+            self.emit(parts)
+            return
+        buffer = self.buffer
+        buffer.append(parts[0])
+        if len(buffer) >= FLUSH_THRESHOLD:
+            self.flush()
 
     def write_arithmetic(self, command: str) -> None:
         """Writes the assembly code that is the translation of the given
@@ -53,177 +541,28 @@ class CodeWriter:
         Args:
             command (str): an arithmetic command.
         """
-        assembly_command = ""
-        if command == 'add':
-            assembly_command = self.pop_assembly(assembly_command)
-            assembly_command += 'D = M\n'
-            assembly_command = self.pop_assembly(assembly_command)
-            assembly_command += 'M = M+D\n'
-            assembly_command = self.push_assembly(assembly_command)
-        elif command == 'sub':
-            assembly_command = self.pop_assembly(assembly_command)
-            assembly_command += 'D = M\n'
-            assembly_command = self.pop_assembly(assembly_command)
-            assembly_command += 'M = M-D\n'
-            assembly_command = self.push_assembly(assembly_command)
-        elif command == 'neg':
-            assembly_command = self.top_assembly(assembly_command)
-            assembly_command += 'M = -M\n'
-        elif command == 'not':
-            assembly_command = self.top_assembly(assembly_command)
-            assembly_command += 'M = !M\n'
-        elif command == 'and':
-            assembly_command = self.pop_assembly(assembly_command)
-            assembly_command += 'D = M\n'
-            assembly_command = self.top_assembly(assembly_command)
-            assembly_command += 'M = M&D\n'
-        elif command == 'or':
-            assembly_command = self.pop_assembly(assembly_command)
-            assembly_command += 'D = M\n'
-            assembly_command = self.top_assembly(assembly_command)
-            assembly_command += 'M = M|D\n'
-
-        elif command == 'shiftleft':
-            assembly_command += self.top_assembly(assembly_command)
-            assembly_command += 'M = M<<'
-
-        elif command == 'shiftright':
-            assembly_command += self.top_assembly(assembly_command)
-            assembly_command += 'M = M>>'
-        elif command == 'eq':
-            assembly_command = self.pop_assembly(assembly_command)
-            assembly_command += 'D = M\n'
-
-            assembly_command += '@a\n'
-            assembly_command += 'M = D\n'
-            assembly_command += '@a_is_neg' + str(self.current_label) + '\n'
-            assembly_command += 'D;JGT\n'
-            assembly_command += '@b_is_pos' + str(self.current_label) + '\n'
-
-            assembly_command = self.top_assembly(assembly_command)
-            assembly_command += 'M;JLT\n'
-            assembly_command = self.top_assembly(assembly_command)
-            assembly_command += 'M = 0\n'
-            assembly_command += '@end' + str(self.current_label) + '\n'
-            assembly_command += '0;JMP\n'
-            assembly_command += '(a_is_neg' + str(self.current_label) + ')\n' # here a is bigger then 0
-            assembly_command = self.top_assembly(assembly_command)
-            assembly_command += 'D = M\n'
-            assembly_command += '@b\n'
-            assembly_command += 'M = D\n'
-            assembly_command += '@b_is_pos' + str(self.current_label) + '\n'
-            assembly_command += 'D;JGT\n'
-            assembly_command = self.top_assembly(assembly_command)
-            assembly_command += 'M = 0\n'
-            assembly_command += '@end' + str(self.current_label) + '\n'
-            assembly_command += '0;JMP\n'
-            assembly_command += '(b_is_pos' + str(self.current_label) + ')' + '\n'
-
-            assembly_command += '@a\n'
-            assembly_command += 'D = M\n'
-            assembly_command += '@b\n'
-            assembly_command += 'D = M-D\n'
-            assembly_command += '@is_eq' + str(self.current_label) + '\n'
-            assembly_command += 'D;JEQ\n'
-            assembly_command = self.top_assembly(assembly_command)
-            assembly_command += 'M = 0\n'
-            assembly_command += '@end' + str(self.current_label) + '\n'
-            assembly_command += '0;JMP\n'
-            assembly_command += '(is_eq' + str(self.current_label) + ')\n'
-            assembly_command = self.top_assembly(assembly_command)
-            assembly_command += 'M = -1\n'
-            assembly_command += '(end' + str(self.current_label) + ')\n'
-            self.current_label += 1
-
-        elif command == 'gt':
-            assembly_command = self.pop_assembly(assembly_command)
-            assembly_command += 'D = M\n'
-
-            assembly_command += '@a\n'
-            assembly_command += 'M = D\n'
-            assembly_command += '@a_is_neg' + str(self.current_label) + '\n'
-            assembly_command += 'D;JGT\n'
-            assembly_command += '@b_is_pos' + str(self.current_label) + '\n'
-            assembly_command = self.top_assembly(assembly_command)
-            assembly_command += 'M;JLT\n'
-            assembly_command = self.top_assembly(assembly_command)
-            assembly_command += 'M = -1\n'
-            assembly_command += '@end' + str(self.current_label) + '\n'
-            assembly_command += '0;JMP\n'
-            assembly_command += '(a_is_neg' + str(self.current_label) + ')\n' # here a is bigger then 0
-            assembly_command = self.top_assembly(assembly_command)
-            assembly_command += 'D = M\n'
-            assembly_command += '@b\n'
-            assembly_command += 'M = D\n'
-            assembly_command += '@b_is_pos' + str(self.current_label) + '\n'
-            assembly_command += 'D;JGT\n'
-            assembly_command = self.top_assembly(assembly_command)
-            assembly_command += 'M = 0\n'
-            assembly_command += '@end' + str(self.current_label) + '\n'
-            assembly_command += '0;JMP\n'
-            assembly_command += '(b_is_pos' + str(self.current_label) + ')' + '\n'
-
-            assembly_command += '@a\n'
-            assembly_command += 'D = M\n'
-            assembly_command += '@b\n'
-            assembly_command += 'D = M-D\n'
-            assembly_command += '@is_gt' + str(self.current_label) + '\n'
-            assembly_command += 'D;JGT\n'
-            assembly_command = self.top_assembly(assembly_command)
-            assembly_command += 'M = 0\n'
-            assembly_command += '@end' + str(self.current_label) + '\n'
-            assembly_command += '0;JMP\n'
-            assembly_command += '(is_gt' + str(self.current_label) + ')\n'
-            assembly_command = self.top_assembly(assembly_command)
-            assembly_command += 'M = -1\n'
-            assembly_command += '(end' + str(self.current_label) + ')\n'
-            self.current_label += 1
-
-        elif command == 'lt':
-            assembly_command = self.pop_assembly(assembly_command)
-            assembly_command += 'D = M\n'
-
-            assembly_command += '@a\n'
-            assembly_command += 'M = D\n'
-            assembly_command += '@a_is_neg' + str(self.current_label) + '\n'
-            assembly_command += 'D;JGT\n'
-            assembly_command += '@b_is_pos' + str(self.current_label) + '\n'
-            assembly_command = self.top_assembly(assembly_command)
-            assembly_command += 'M;JLT\n'
-            assembly_command = self.top_assembly(assembly_command)
-            assembly_command += 'M = 0\n'
-            assembly_command += '@end' + str(self.current_label) + '\n'
-            assembly_command += '0;JMP\n'
-            assembly_command += '(a_is_neg' + str(self.current_label) + ')\n' # here a is bigger then 0
-            assembly_command = self.top_assembly(assembly_command)
-            assembly_command += 'D = M\n'
-            assembly_command += '@b\n'
-            assembly_command += 'M = D\n'
-            assembly_command += '@b_is_pos' + str(self.current_label) + '\n'
-            assembly_command += 'D;JGT\n'
-            assembly_command = self.top_assembly(assembly_command)
-            assembly_command += 'M = -1\n'
-            assembly_command += '@end' + str(self.current_label) + '\n'
-            assembly_command += '0;JMP\n'
-            assembly_command += '(b_is_pos' + str(self.current_label) + ')' + '\n'
-
-            assembly_command += '@a\n'
-            assembly_command += 'D = M\n'
-            assembly_command += '@b\n'
-            assembly_command += 'D = M-D\n'
-            assembly_command += '@is_lt' + str(self.current_label) + '\n'
-            assembly_command += 'D;JLT\n'
-            assembly_command = self.top_assembly(assembly_command)
-            assembly_command += 'M = 0\n'
-            assembly_command += '@end' + str(self.current_label) + '\n'
-            assembly_command += '0;JMP\n'
-            assembly_command += '(is_lt' + str(self.current_label) + ')\n'
-            assembly_command = self.top_assembly(assembly_command)
-            assembly_command += 'M = -1\n'
-            assembly_command += '(end' + str(self.current_label) + ')\n'
-            self.current_label += 1
-
-        self.output_file.write(assembly_command)
+        if command not in ARITHMETIC_COMMANDS:
+            raise ValueError("not an arithmetic command: " + command)
+        comparisons = COMPARISON_PARTS
+        if self.shared_comparisons:
+            comparisons = COMPARISON_CALL_PARTS
+            self.used_routines.add(command)
+        self.emit(comparisons.get(command) or
+                  [ARITHMETIC_TEMPLATES[command]])
+
+    def write_shared_routines(self) -> None:
+        """Writes the shared routines the program used, behind a jump for a
+        program that ends by falling through.
+        """
+        routines = [
+            routine for name, routine in
+            SHARED_ROUTINES[self.select_instructions].items()
+            if name in self.used_routines]
+        if not routines:
+            return
+        self.emit(["@" + ROUTINES_END_LABEL + "\n0;JMP\n" +
+                   "".join(routines) + "(" + ROUTINES_END_LABEL + ")\n"])
+        self.used_routines.clear()
 
     def write_push_pop(self, command: str, segment: str, index: int) -> None:
         """Writes the assembly code that is the translation of the given
@@ -234,259 +573,48 @@ class CodeWriter:
             segment (str): the memory segment to operate on.
             index (int): the index in the memory segment.
         """
-        # Your code goes here!
-        if command == "C_PUSH":
-            ret_str = ''
-            if segment == "static":
-                ret_str = "@" + self.static_var_filename + "." + str(index) + "\n"
-                ret_str += "D=M\n"
-            elif segment == "that":
-                ret_str += "@" + str(index) + "\n"
-                ret_str += "D=A\n"
-                ret_str += "@THAT\n"
-                ret_str += "A=M+D\n"
-                ret_str += "D=M\n"
-            elif segment == "this":
-                ret_str += "@" + str(index) + "\n"
-                ret_str += "D=A\n"
-                ret_str += "@THIS\n"
-                ret_str += "A=M+D\n"
-                ret_str += "D=M\n"
-            elif segment == "constant":
-                ret_str = "@" + str(index) + "\n"
-                ret_str += "D=A\n"
-            elif segment == "temp":
-                ret_str = "@" + str(index) + "\n"
-                ret_str += "D=A\n"
-                ret_str += "@5\n"
-                ret_str += "A=A+D\n"
-                ret_str += "D=M\n"
-            elif segment == "local":
-                ret_str = "@" + str(index) + "\n"
-                ret_str += "D=A\n"
-                ret_str += "@LCL\n"
-                ret_str += "A=M+D\n"
-                ret_str += "D=M\n"
-            elif segment == "pointer":
-                ret_str = "@" + str(index) + "\n"
-                ret_str += "D=A\n"
-                ret_str += "@3\n"
-                ret_str += "A=A+D\n"
-                ret_str += "D=M\n"
-            elif segment == "argument":
-                ret_str = "@" + str(index) + "\n"
-                ret_str += "D=A\n"
-                ret_str += "@ARG\n"
-                ret_str += "A=M+D\n"
-                ret_str += "D=M\n"
-            ret_str += self.push_template()
-        elif command == "C_POP":
-            ret_str = ''
-            if segment == "static":
-                ret_str = "@SP\n"
-                ret_str += "AM=M-1\n"
-                ret_str += "D=M\n"
-                ret_str += "@" + self.static_var_filename + "." + str(index) + "\n"
-                ret_str += "M=D\n"
-            elif segment == "that":
-                ret_str = "@" + str(index) + "\n"
-                ret_str += "D=A\n"
-                ret_str += "@THAT\n"
-                ret_str += "D=M+D\n"
-                ret_str += self.pop_template()
-            elif segment == "this":
-                ret_str = "@" + str(index) + "\n"
-                ret_str += "D=A\n"
-                ret_str += "@THIS\n"
-                ret_str += "D=M+D\n"
-                ret_str += self.pop_template()
-            elif segment == "temp":
-                ret_str = "@" + str(index) + "\n"
-                ret_str += "D=A\n"
-                ret_str += "@5\n"
-                ret_str += "D=A+D\n"
-                ret_str += self.pop_template()
-            elif segment == "local":
-                ret_str += "@" + str(index) + "\n"
-                ret_str += "D=A\n"
-                ret_str += "@LCL\n"
-                ret_str += "D=M+D\n"
-                ret_str += self.pop_template()
-            elif segment == "pointer":
-                ret_str = "@" + str(index) + "\n"
-                ret_str += "D=A\n"
-                ret_str += "@3\n"
-                ret_str += "D=A+D\n"
-                ret_str += self.pop_template()
-            elif segment == "argument":
-                ret_str = "@" + str(index) + "\n"
-                ret_str += "D=A\n"
-                ret_str += "@ARG\n"
-                ret_str += "D=M+D\n"
-                ret_str += self.pop_template()
-        self.output_file.write(ret_str)
-
-    def push_template(self):
-        push_str = "@SP\n"
-        push_str += "A=M\n"
-        push_str += "M=D\n"
-        push_str += "@SP\n"
-        push_str += "M=M+1\n"
-        return push_str
-
-    def pop_template(self):
-        pop_str = "@R13\n"
-        pop_str += "M=D\n"
-        pop_str += "@SP\n"
-        pop_str += "AM=M-1\n"
-        pop_str += "D=M\n"
-        pop_str += "@R13\n"
-        pop_str += "A=M\n"
-        pop_str += "M=D\n"
-        return pop_str
+        self.emit([push_pop_code(
+            command, segment, index,
+            self.static_var_filename if segment == "static" else "",
+            self.select_instructions)])
 
     def close(self) -> None:
-        """Closes the output file."""
+        """Writes the buffered code and closes the output file."""
+        self.flush()
         self.output_file.close()
 
     def writeReturn(self):
-        ret_str = ''
-        ret_str += "@LCL\n"
-        ret_str += "D=M\n"
-        ret_str += "@endFrame\n"
-        ret_str += "M=D\n"
-
-        ret_str += "A=D\n"
-        for i in range(5):
-            ret_str += "A=A-1\n"
-        ret_str += "D=M\n"
-        ret_str += "@retAddr\n"
-        ret_str += "M=D\n"
-
-        ret_str += "@ARG\n"
-        ret_str += "D=M\n"
-        ret_str += self.pop_template()
-
-        ret_str += "@ARG\n"
-        ret_str += "D=M+1\n"
-        ret_str += "@SP\n"
-        ret_str += "M=D\n"
-
-        ret_str += "@endFrame\n"
-        ret_str += "D=M-1\n"
-        ret_str += "A=D\n"
-        ret_str += "D=M\n"
-        ret_str += "@THAT\n"
-        ret_str += "M=D\n"
-
-        ret_str += "@endFrame\n"
-        ret_str += "D=M-1\n"
-        ret_str += "D=D-1\n"
-        ret_str += "A=D\n"
-        ret_str += "D=M\n"
-        ret_str += "@THIS\n"
-        ret_str += "M=D\n"
-
-        ret_str += "@endFrame\n"
-        ret_str += "D=M-1\n"
-        for i in range(2):
-            ret_str += "D=D-1\n"
-        ret_str += "A=D\n"
-        ret_str += "D=M\n"
-        ret_str += "@ARG\n"
-        ret_str += "M=D\n"
-
-        ret_str += "@endFrame\n"
-        ret_str += "D=M-1\n"
-        for i in range(3):
-            ret_str += "D=D-1\n"
-        ret_str += "A=D\n"
-        ret_str += "D=M\n"
-        ret_str += "@LCL\n"
-        ret_str += "M=D\n"
-        ret_str += "@retAddr\n"
-        ret_str += "A=M\n"
-        ret_str += "0;JMP\n"
-
-        self.output_file.write(ret_str)
+        if self.shared_calls:
+            self.used_routines.add("return")
+            self.emit([RETURN_SITE_TEMPLATE])
+        elif self.select_instructions:
+            self.emit([SELECTED_RETURN_TEMPLATE])
+        else:
+            self.emit([RETURN_TEMPLATE])
 
     def writeInit(self):
-        assembly_command = '@256\n'
-        assembly_command += 'D = A\n'
-        assembly_command += '@SP\n'
-        assembly_command += 'M = D\n'
-        self.output_file.write(assembly_command)
+        self.emit([INIT_TEMPLATE])
         self.writeCall('Sys.init', 0)
-        # return
 
     def writeLabel(self, label: str):
-        label = label.split()[1]
-        assembly_command = "(" + label + ")\n"
-        self.output_file.write(assembly_command)
+        self.emit(["(" + label + ")\n"])
 
     def writeGoto(self, label: str):
-        assembly_command = "@" + label + "\n"
-        assembly_command += "0;JMP\n"
-        self.output_file.write(assembly_command)
+        self.emit(["@" + label + "\n0;JMP\n"])
 
     def writeIf(self, label: str):
-        assembly_command = ""
-        assembly_command += self.pop_assembly(assembly_command)
-        assembly_command += "D = M\n"
-        assembly_command += "@end" + str(self.current_label) + "\n"
-        assembly_command += "D;JEQ\n"
-        assembly_command += "@" + label + "\n"
-        assembly_command += "0;JMP\n"
-        assembly_command += "(end" + str(self.current_label) + ")\n"
-        self.current_label += 1
-        self.output_file.write(assembly_command)
+        self.emit([POP_ASSEMBLY + "D = M\n@end", "\nD;JEQ\n@" + label +
+                   "\n0;JMP\n(end", ")\n"])
 
     def writeCall(self, functionName: str, numArgs: int):
-        ret_str = "@returnAddress" + str(self.current_label) + "\n"
-        ret_str += "D=A\n"
-        ret_str += self.push_template()
-
-        ret_str += "@LCL\n"
-        ret_str += "D=M\n"
-        ret_str += self.push_template()
-
-        ret_str += "@ARG\n"
-        ret_str += "D=M\n"
-        ret_str += self.push_template()
-
-        ret_str += "@THIS\n"
-        ret_str += "D=M\n"
-        ret_str += self.push_template()
-
-        ret_str += "@THAT\n"
-        ret_str += "D=M\n"
-        ret_str += self.push_template()
-
-        ret_str += "@SP\n"
-        ret_str += "D=M\n"
-        for i in range(5):
-            ret_str += "D=D-1\n"
-        for i in range(numArgs):
-            ret_str += "D = D-1\n"
-        ret_str += "@ARG\n"
-        ret_str += "M=D\n"
-
-        ret_str += "@SP\n"
-        ret_str += "D=M\n"
-        ret_str += "@LCL\n"
-        ret_str += "M=D\n"
-
-        ret_str += "@" + functionName + "\n"
-        ret_str += "0;JMP\n"
-
-        ret_str += "(returnAddress" + str(self.current_label) + ")\n"
-        self.current_label += 1
-
-        self.output_file.write(ret_str)
+        if self.shared_calls:
+            self.used_routines.add("call")
+            self.emit(shared_call_parts(functionName, numArgs))
+            return
+        self.emit(["@returnAddress", "\n" + call_code(
+            functionName, numArgs, self.select_instructions) +
+            "(returnAddress", ")\n"])
 
     def writeFunction(self, functionName: str, numLocals: int):
-        assembly_command = "(" + functionName + ")\n"
-        for i in range(numLocals):
-            assembly_command += "D = 0\n"
-            assembly_command += self.push_template()
-        self.output_file.write(assembly_command)
\ No newline at end of file
+        self.emit([function_code(functionName, numLocals,
+                                 self.select_instructions)])
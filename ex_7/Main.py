@@ -4,11 +4,12 @@ https://www.nand2tetris.org (Shimon Schocken and Noam Nisan, 2017)
 and as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
 Unported License (https://creativecommons.org/licenses/by-nc-sa/3.0/).
 """
+import argparse
+import io
 import os
-import sys
 import typing
 from Parser import Parser
-from CodeWriter import CodeWriter
+from CodeWriter import CodeWriter, instruction_count
 
 
 def translate_file(
@@ -24,43 +25,58 @@ def translate_file(
     # input_filename, input_extension = os.path.splitext(os.path.basename(input_file.name))
     input_filename, input_extension = os.path.splitext(os.path.basename(input_file.name))
     cw.set_file_name(input_filename)
-    p = Parser(input_file)
-    while p.has_more_commands():
-        p.advance()
-        if p.has_more_commands():
-            cmd = p.current_comment.strip()
-            output_file.write("//" + cmd + "\n")
-            ct = p.command_type()
-            if ct == "C_ARITHMETIC":
-                cw.write_arithmetic(cmd)
-            elif ct == "C_POP" or ct == "C_PUSH":
-                cw.write_push_pop(ct, cmd.split()[1], p.arg2())
-            elif ct == "C_LABEL":
-                cw.writeLabel(cmd)
-            elif ct == "C_GOTO":
-                cw.writeGoto(cmd.split()[1])
-            elif ct == "C_IF":
-                cw.writeIf(cmd.split()[1])
-            elif ct == "C_CALL":
-                lst = cmd.split()
-                cw.writeCall(lst[1], int(lst[2]))
-            elif ct == "C_RETURN":
-                cw.writeReturn()
-            elif ct == "C_FUNCTION":
-                lst = cmd.split()
-                cw.writeFunction(lst[1], int(lst[2]))
+    for command in Parser(input_file).commands:
+        cw.write_command(command)
+    cw.flush()
     # cw.close()
 
 
+def translate_program(input_paths: typing.Sequence[str],
+                      output_file: typing.TextIO, cw) -> None:
+    """Translates the .vm files of a program, after the bootstrap code.
+
+    Args:
+        input_paths (typing.Sequence[str]): the files of the program, of
+        which those that are not .vm files are skipped.
+        output_file (typing.TextIO): writes all output to this file.
+        cw (CodeWriter): writes the code to output_file.
+    """
+    cw.writeInit()
+    for input_path in input_paths:
+        filename, extension = os.path.splitext(input_path)
+        if extension.lower() != ".vm":
+            continue
+        with open(input_path, 'r') as input_file:
+            translate_file(input_file, output_file, cw)
+    cw.write_shared_routines()
+    cw.flush()
+
+
 if "__main__" == __name__:
     # Parses the input path and calls translate_file on each input file.
     # This opens both the input and the output files!
     # Both are closed automatically when the code finishes running.
     # If the output file does not exist, it is created automatically in the
     # correct path, using the correct filename.
-    if not len(sys.argv) == 2:
-        sys.exit("Invalid usage, please use: VMtranslator <input path>")
-    argument_path = os.path.abspath(sys.argv[1])
+    argument_parser = argparse.ArgumentParser(prog="VMtranslator")
+    argument_parser.add_argument("input_path")
+    argument_parser.add_argument(
+        "--shared-comparisons", action="store_true",
+        help="call one shared routine per comparison operator instead of "
+             "inlining every eq, gt and lt, for a smaller ROM")
+    argument_parser.add_argument(
+        "--shared-calls", action="store_true",
+        help="jump to one shared call routine and one shared return "
+             "routine instead of inlining every call and return")
+    argument_parser.add_argument(
+        "--generic", action="store_true",
+        help="emit the generic code for every segment access and frame, "
+             "without instruction selection")
+    argument_parser.add_argument(
+        "--report", action="store_true",
+        help="print the instructions instruction selection saved")
+    arguments = argument_parser.parse_args()
+    argument_path = os.path.abspath(arguments.input_path)
     if os.path.isdir(argument_path):
         files_to_translate = [
             os.path.join(argument_path, filename)
@@ -72,11 +88,20 @@ if "__main__" == __name__:
         output_path, extension = os.path.splitext(argument_path)
     output_path += ".asm"
     with open(output_path, 'w') as output_file:
-        cw = CodeWriter(output_file)
-        cw.writeInit()
-        for input_path in files_to_translate:
-            filename, extension = os.path.splitext(input_path)
-            if extension.lower() != ".vm":
-                continue
-            with open(input_path, 'r') as input_file:
-                translate_file(input_file, output_file, cw)
\ No newline at end of file
+        cw = CodeWriter(output_file, arguments.shared_comparisons,
+                        arguments.shared_calls, not arguments.generic)
+        translate_program(files_to_translate, output_file, cw)
+    if arguments.report:
+        # Translates the program again with the generic code to compare.
+        generic_output = io.StringIO()
+        translate_program(files_to_translate, generic_output, CodeWriter(
+            generic_output, arguments.shared_comparisons,
+            arguments.shared_calls, False))
+        with open(output_path) as output_file:
+            selected_count = instruction_count(output_file.read())
+        generic_count = instruction_count(generic_output.getvalue())
+        saved = generic_count - selected_count
+        print(os.path.basename(output_path) + ": " + str(selected_count) +
+              " instructions, " + str(saved) + " saved by instruction "
+              "selection (" + format(100 * saved / max(generic_count, 1),
+                                     ".1f") + "%)")
\ No newline at end of file
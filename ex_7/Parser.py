@@ -1,4 +1,3 @@
-
 """This file is part of nand2tetris, as taught in The Hebrew University,
 and was written by Aviv Yaish according to the specifications given in
 https://www.nand2tetris.org (Shimon Schocken and Noam Nisan, 2017)
@@ -8,12 +7,52 @@ Unported License (https://creativecommons.org/licenses/by-nc-sa/3.0/).
 import typing
 
 
+C_ARITHMETIC = "C_ARITHMETIC"
+C_PUSH = "C_PUSH"
+C_POP = "C_POP"
+C_LABEL = "C_LABEL"
+C_GOTO = "C_GOTO"
+C_IF = "C_IF"
+C_FUNCTION = "C_FUNCTION"
+C_RETURN = "C_RETURN"
+C_CALL = "C_CALL"
+
+# The opcode of every VM command. The arithmetic commands come first, in the
+# order of ARITHMETIC_COMMANDS.
+ARITHMETIC_COMMANDS = ["add", "sub", "neg", "eq", "gt", "lt", "and", "or",
+                       "not"]
+ADD, SUB, NEG, EQ, GT, LT, AND, OR, NOT, PUSH, POP, LABEL, GOTO, IF_GOTO, \
+    FUNCTION, CALL, RETURN = range(17)
+COMMAND_NAMES = ARITHMETIC_COMMANDS + ["push", "pop", "label", "goto",
+                                       "if-goto", "function", "call",
+                                       "return"]
+OPCODES = {name: opcode for opcode, name in enumerate(COMMAND_NAMES)}
+COMMAND_TYPES = [C_ARITHMETIC] * len(ARITHMETIC_COMMANDS) + \
+    [C_PUSH, C_POP, C_LABEL, C_GOTO, C_IF, C_FUNCTION, C_CALL, C_RETURN]
+
+SEGMENTS = ["argument", "local", "static", "constant", "this", "that",
+            "pointer", "temp"]
+SEGMENT_IDS = {name: segment for segment, name in enumerate(SEGMENTS)}
+NO_SEGMENT = -1
+# The number of words in every command, by opcode.
+_WORD_COUNTS = [1] * len(ARITHMETIC_COMMANDS) + [3, 3, 2, 2, 2, 3, 3, 1]
+
+# A parsed command: (opcode, segment id or NO_SEGMENT, integer argument or
+# 0, symbol or "").
+Command = typing.Tuple[int, int, int, str]
+
+
 class Parser:
     """
     Handles the parsing of a single .vm file, and encapsulates access to the
     input code. It reads VM commands, parses them, and provides convenient
     access to their components.
     In addition, it removes all white space and comments.
+
+    The whole input is parsed in a single scan when the parser is created:
+    `commands` holds one (opcode, segment id, integer argument, symbol)
+    record per VM command, see iter_commands(), so translating a file is a
+    loop over the records with no further string work.
     """
 
     def __init__(self, input_file: typing.TextIO) -> None:
@@ -22,14 +61,10 @@ class Parser:
         Args:
             input_file (typing.TextIO): input file.
         """
-        # Your code goes here!
-        # A good place to start is:
-        # input_lines = input_file.read().splitlines()
-        self.input_lines = input_file.read().splitlines()
+        self.commands = list(iter_commands(input_file))
         self.line_ind = 0
-        self.line_num = len(self.input_lines)
-        self.current_comment = self.input_lines[self.line_ind]
-
+        self.line_num = len(self.commands)
+        self.current_command = None
 
     def has_more_commands(self) -> bool:
         """Are there more commands in the input?
@@ -44,15 +79,8 @@ class Parser:
         command. Should be called only if has_more_commands() is true. Initially
         there is no current command.
         """
+        self.current_command = self.commands[self.line_ind]
         self.line_ind += 1
-        if self.has_more_commands():
-            self.current_comment = self.input_lines[self.line_ind]
-            self.current_comment.strip()
-            c = self.current_comment.find('//')
-            if c != -1:
-                self.current_comment = self.current_comment[:c]
-        while self.current_comment == '':
-            self.advance()
 
     def command_type(self) -> str:
         """
@@ -63,27 +91,7 @@ class Parser:
             "C_PUSH", "C_POP", "C_LABEL", "C_GOTO", "C_IF", "C_FUNCTION",
             "C_RETURN", "C_CALL".
         """
-        self.current_comment = self.current_comment.strip()
-        if 'function' in self.current_comment:
-            return 'C_FUNCTION'
-        elif 'call' in self.current_comment:
-            return 'C_CALL'
-        elif 'pop' in self.current_comment:
-            return 'C_POP'
-        elif 'push' in self.current_comment:
-            return 'C_PUSH'
-        elif 'add' == self.current_comment or 'sub' == self.current_comment or 'neg' == self.current_comment or \
-                'eq' == self.current_comment or 'gt' == self.current_comment or 'lt' == self.current_comment or \
-                'and' == self.current_comment or 'or' == self.current_comment or 'not' == self.current_comment:
-            return 'C_ARITHMETIC'
-        elif 'if-goto' in self.current_comment:
-            return 'C_IF'
-        elif 'goto' in self.current_comment:
-            return 'C_GOTO'
-        elif 'return' in self.current_comment:
-            return 'C_RETURN'
-        return 'C_LABEL'
-
+        return COMMAND_TYPES[self.current_command[0]]
 
     def arg1(self) -> str:
         """
@@ -92,11 +100,12 @@ class Parser:
             "C_ARITHMETIC", the command itself (add, sub, etc.) is returned.
             Should not be called if the current command is "C_RETURN".
         """
-        if self.command_type == 'C_ARITHMETIC':
-            return self.current_comment
-        c = self.current_comment.find(" ")
-        return self.current_comment[0:c]
-
+        opcode, segment, _, symbol = self.current_command
+        if opcode < PUSH:
+            return ARITHMETIC_COMMANDS[opcode]
+        if segment != NO_SEGMENT:
+            return SEGMENTS[segment]
+        return symbol
 
     def arg2(self) -> int:
         """
@@ -105,5 +114,62 @@ class Parser:
             called only if the current command is "C_PUSH", "C_POP",
             "C_FUNCTION" or "C_CALL".
         """
-        lst = self.current_comment.split()
-        return int(lst[-1])
+        return self.current_command[2]
+
+
+def iter_commands(lines: typing.Iterable[str]) -> typing.Iterator[Command]:
+    """Parses the commands of a VM program one line at a time, without
+    keeping the lines around.
+
+    Args:
+        lines (typing.Iterable[str]): the lines of the program, e.g. an open
+        file.
+
+    Yields:
+        Command: the record of every VM command.
+    """
+    for line_number, line in enumerate(lines, 1):
+        comment_idx = line.find('//')
+        if comment_idx != -1:
+            line = line[:comment_idx]
+        words = line.split()
+        if not words:
+            continue
+        opcode = OPCODES.get(words[0])
+        if opcode is None:
+            raise ValueError("line " + str(line_number) +
+                             ": unknown VM command '" + words[0] + "'")
+        if len(words) != _WORD_COUNTS[opcode] or \
+                (opcode in (PUSH, POP) and words[1] not in SEGMENT_IDS) or \
+                (_WORD_COUNTS[opcode] == 3 and not words[2].isdigit()):
+            raise ValueError("line " + str(line_number) +
+                             ": malformed VM command '" + " ".join(words) +
+                             "'")
+        if opcode == PUSH or opcode == POP:
+            yield opcode, SEGMENT_IDS[words[1]], int(words[2]), ""
+        elif opcode == FUNCTION or opcode == CALL:
+            yield opcode, NO_SEGMENT, int(words[2]), words[1]
+        elif opcode == LABEL or opcode == GOTO or opcode == IF_GOTO:
+            yield opcode, NO_SEGMENT, 0, words[1]
+        else:
+            yield opcode, NO_SEGMENT, 0, ""
+
+
+def command_text(command: Command) -> str:
+    """
+    Args:
+        command (Command): a parsed command.
+
+    Returns:
+        str: the command as VM code, with single spaces between its words,
+        e.g. "push constant 7".
+    """
+    opcode, segment, argument, symbol = command
+    if opcode == PUSH or opcode == POP:
+        return COMMAND_NAMES[opcode] + " " + SEGMENTS[segment] + " " + \
+            str(argument)
+    if opcode == FUNCTION or opcode == CALL:
+        return COMMAND_NAMES[opcode] + " " + symbol + " " + str(argument)
+    if symbol:
+        return COMMAND_NAMES[opcode] + " " + symbol
+    return COMMAND_NAMES[opcode]